@@ -0,0 +1,20 @@
+"""
+ASGI config for app project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Django 2.2 has no ASGI support of its own, so food_poll.asgi runs the WSGI
+application on a thread pool behind an asyncio front end, e.g.
+
+    uvicorn app.asgi:application
+
+Vote tallies of /menus/results/stream/ are published in process, so serve
+the stream from a single worker.
+"""
+
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+from food_poll.asgi import get_asgi_application  # noqa: E402
+
+application = get_asgi_application()
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'food_poll.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,13 +76,102 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# FOOD_POLL_DB picks the database profile: 'sqlite' (default) or
+# 'postgresql', which needs psycopg2 and reads FOOD_POLL_DB_NAME, _USER,
+# _PASSWORD, _HOST and _PORT. FOOD_POLL_DB_CONN_MAX_AGE keeps connections
+# open for that many seconds between requests (0 closes them after every
+# request)
+
+FOOD_POLL_DB = os.environ.get('FOOD_POLL_DB', 'sqlite')
+
+FOOD_POLL_DB_CONN_MAX_AGE = int(
+    os.environ.get('FOOD_POLL_DB_CONN_MAX_AGE', 60))
+
+if FOOD_POLL_DB == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('FOOD_POLL_DB_NAME', 'food_poll'),
+            'USER': os.environ.get('FOOD_POLL_DB_USER', ''),
+            'PASSWORD': os.environ.get('FOOD_POLL_DB_PASSWORD', ''),
+            'HOST': os.environ.get('FOOD_POLL_DB_HOST', ''),
+            'PORT': os.environ.get('FOOD_POLL_DB_PORT', ''),
+            'CONN_MAX_AGE': FOOD_POLL_DB_CONN_MAX_AGE,
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('FOOD_POLL_DB_NAME',
+                                   os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': FOOD_POLL_DB_CONN_MAX_AGE,
+        }
+    }
+
+# Read replica: with FOOD_POLL_DB_REPLICA set (the replica's file for
+# SQLite, its host for PostgreSQL) safe-method API requests read from the
+# 'replica' alias. Users who wrote within the last
+# FOOD_POLL_REPLICA_STICKY_SECONDS keep reading from the primary, so they
+# see their own writes. An SQLite replica is kept up to date with
+# `manage.py sync_replica`
+
+FOOD_POLL_DB_REPLICA = os.environ.get('FOOD_POLL_DB_REPLICA')
+
+FOOD_POLL_REPLICA_STICKY_SECONDS = 10
+
+if FOOD_POLL_DB_REPLICA:
+    DATABASES['replica'] = dict(DATABASES['default'],
+                                TEST={'MIRROR': 'default'})
+    if FOOD_POLL_DB == 'postgresql':
+        DATABASES['replica']['HOST'] = FOOD_POLL_DB_REPLICA
+    else:
+        DATABASES['replica']['NAME'] = FOOD_POLL_DB_REPLICA
+
+# Separate database for API request logs: with FOOD_POLL_DB_LOGS set (a
+# file for SQLite, a database name for PostgreSQL) rest_framework_tracking's
+# APIRequestLog is written to and read from the 'logs' alias, so logging
+# doesn't compete with votes for SQLite's single writer. Create its table
+# with `manage.py migrate --database logs`
+
+FOOD_POLL_DB_LOGS = os.environ.get('FOOD_POLL_DB_LOGS')
+
+if FOOD_POLL_DB_LOGS:
+    DATABASES['logs'] = dict(DATABASES['default'], NAME=FOOD_POLL_DB_LOGS,
+                             TEST={})
+    if FOOD_POLL_DB != 'postgresql':
+        DATABASES['logs']['TEST']['NAME'] = os.path.join(
+            BASE_DIR, 'test_logs.sqlite3')
+
+DATABASE_ROUTERS = [
+    'food_poll.routers.LogsRouter',
+    'food_poll.routers.ReplicaRouter',
+]
+
+# PRAGMAs run on every new SQLite connection. WAL lets readers proceed
+# while a vote is written, synchronous=NORMAL is safe with WAL and skips
+# an fsync per commit, busy_timeout makes writers wait (in milliseconds)
+# instead of failing with "database is locked"
+
+FOOD_POLL_SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
 }
 
+# SQLite files that are committed to the repository. The journal mode is
+# stored in the database file, so these are left in their rollback journal
+# mode and running the app doesn't rewrite them
+
+FOOD_POLL_SQLITE_COMMITTED_DATABASES = [os.path.join(BASE_DIR, 'db.sqlite3')]
+
+# Check that a reused persistent connection still works before each request
+# and reconnect if it doesn't
+
+FOOD_POLL_DB_HEALTH_CHECKS = \
+    os.environ.get('FOOD_POLL_DB_HEALTH_CHECKS') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -127,6 +217,88 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
+        'food_poll.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication'
     )
 }
+
+# Page size of the keyset-paginated endpoints (menus, menuvotes, log_entries)
+
+FOOD_POLL_PAGE_SIZE = 100
+
+FOOD_POLL_MAX_PAGE_SIZE = 1000
+
+# Seconds a user's profile flags and restaurant ids are cached for
+# permission checks; the entry is dropped whenever the profile changes
+
+FOOD_POLL_PRINCIPAL_CACHE_TIMEOUT = 300
+
+# Seconds the shared payload of /menus/today/ and /menus/results/ is cached
+# for. Entries are keyed on a version that every Menu and MenuVote write
+# bumps, so with several processes the cache has to be shared between them
+# (e.g. memcached) instead of the default per-process memory cache
+
+FOOD_POLL_MENU_CACHE_TIMEOUT = 300
+
+# Seconds a resolved API token stays in the in-process token cache. Revoking
+# a token clears it in the revoking process right away; other processes keep
+# accepting it until their entry expires
+
+FOOD_POLL_TOKEN_CACHE_TIMEOUT = 60
+
+# Session mode: 'db' keeps sessions in the database and loads the user from
+# it on every request, 'cache' keeps sessions in the cache (falling back to
+# the database) and caches users for FOOD_POLL_USER_CACHE_TIMEOUT seconds.
+# Cached users are dropped when they are saved or deleted, so with several
+# processes the cache has to be shared between them
+
+FOOD_POLL_SESSION_MODE = os.environ.get('FOOD_POLL_SESSION_MODE', 'db')
+
+FOOD_POLL_USER_CACHE_TIMEOUT = 300
+
+if FOOD_POLL_SESSION_MODE == 'cache':
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = ['food_poll.backends.CachedModelBackend']
+
+# ASGI entry point (app/asgi.py): threads that run views in each process,
+# and threads that iterate open /menus/results/stream/ responses
+
+FOOD_POLL_ASGI_THREADS = int(os.environ.get('FOOD_POLL_ASGI_THREADS', 8))
+
+FOOD_POLL_ASGI_STREAM_THREADS = 100
+
+# Seconds lifespan shutdown waits for running requests and open streams
+# before reporting shutdown complete anyway
+
+FOOD_POLL_ASGI_SHUTDOWN_TIMEOUT = 30
+
+# Seconds between keepalive comments on /menus/results/stream/
+
+FOOD_POLL_STREAM_KEEPALIVE = 15
+
+# API request logging: 'sync' saves every log entry inside the request,
+# 'buffered' queues entries and writes them in batches from a background
+# thread. POLICY decides what happens when the queue is full:
+# 'drop', 'sample' (keep SAMPLE_RATE of entries) or 'block' (wait up to
+# BLOCK_TIMEOUT seconds for free space, then drop the entry)
+
+FOOD_POLL_LOG_MODE = os.environ.get('FOOD_POLL_LOG_MODE', 'sync')
+
+FOOD_POLL_LOG_BUFFER = {
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_QUEUE_SIZE': 10000,
+    'POLICY': 'drop',
+    'SAMPLE_RATE': 0.1,
+    'BLOCK_TIMEOUT': 1.0,
+}
+
+# Server-Timing header with SQL statement counts and the time spent in
+# authentication, permission checks, serialization and request logging.
+# FOOD_POLL_SERVER_TIMING_DUPLICATES also lists statements that ran more
+# than once in an X-Duplicate-Queries header
+
+FOOD_POLL_SERVER_TIMING = os.environ.get('FOOD_POLL_SERVER_TIMING') == '1'
+
+FOOD_POLL_SERVER_TIMING_DUPLICATES = \
+    os.environ.get('FOOD_POLL_SERVER_TIMING_DUPLICATES') == '1'
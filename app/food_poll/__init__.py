@@ -0,0 +1 @@
+default_app_config = 'food_poll.apps.FoodPollConfig'
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FoodPollConfig(AppConfig):
     name = 'food_poll'
+
+    def ready(self):
+        from . import database, signals  # noqa: F401
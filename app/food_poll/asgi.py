@@ -0,0 +1,180 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+ASGI_THREADS = getattr(settings, 'FOOD_POLL_ASGI_THREADS', 8)
+
+ASGI_STREAM_THREADS = getattr(settings, 'FOOD_POLL_ASGI_STREAM_THREADS', 100)
+
+ASGI_SHUTDOWN_TIMEOUT = getattr(
+    settings, 'FOOD_POLL_ASGI_SHUTDOWN_TIMEOUT', 30)
+
+
+def build_environ(scope, body):
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+async def read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(body)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class ASGIHandler(object):
+    """
+    ASGI application for Django 2.2, which only speaks WSGI. Views run
+    unchanged on a pool of `threads` worker threads. Reading requests and
+    sending responses happens on the event loop, so slow clients don't
+    hold a worker. Streaming responses (the Server-Sent Events tally stream)
+    are iterated on a separate pool, so open streams can't starve regular
+    requests.
+    """
+
+    def __init__(self, wsgi_application, threads=ASGI_THREADS,
+                 stream_threads=ASGI_STREAM_THREADS):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            threads, thread_name_prefix='asgi')
+        self.stream_executor = ThreadPoolExecutor(
+            stream_threads, thread_name_prefix='asgi-stream')
+        self.closing = False
+        self.open_requests = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError("Unsupported ASGI scope type %r" % scope['type'])
+
+        self.open_requests += 1
+        try:
+            await self.handle(scope, receive, send)
+        finally:
+            self.open_requests -= 1
+
+    async def handle(self, scope, receive, send):
+        body = await read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        status, headers, content, response = await loop.run_in_executor(
+            self.executor, self.run_view, scope, body)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        if response is None:
+            await send({'type': 'http.response.body', 'body': content})
+            return
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        chunks = iter(response)
+        try:
+            while not disconnected.done() and not self.closing:
+                chunk = await loop.run_in_executor(
+                    self.stream_executor, next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+        finally:
+            disconnected.cancel()
+            await loop.run_in_executor(self.stream_executor, response.close)
+        await send({'type': 'http.response.body'})
+
+    def run_view(self, scope, body):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers]
+
+        response = self.wsgi_application(
+            build_environ(scope, body), start_response)
+        if getattr(response, 'streaming', False):
+            return started['status'], started['headers'], None, response
+        try:
+            content = b''.join(response)
+        finally:
+            # Fires request_finished, which closes this thread's connections
+            # when CONN_MAX_AGE says so
+            response.close()
+        return started['status'], started['headers'], content, None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def shutdown(self, timeout=None):
+        """
+        Ends open streams at their next event or keepalive and waits, up to
+        `timeout` seconds, for running views and streams. The event loop
+        keeps running meanwhile, as it still sends their responses.
+        """
+        self.closing = True
+
+        async def drain():
+            while self.open_requests:
+                await asyncio.sleep(0.05)
+
+        try:
+            await asyncio.wait_for(
+                drain(), ASGI_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.executor.shutdown(wait=False)
+        self.stream_executor.shutdown(wait=False)
+
+def get_asgi_application():
+    return ASGIHandler(get_wsgi_application())
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication, \
+    get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .backends import build_user, get_user_values
+from .models import AuthToken, hash_token
+
+TOKEN_CACHE_TIMEOUT = getattr(settings, 'FOOD_POLL_TOKEN_CACHE_TIMEOUT', 60)
+
+MAX_CACHED_TOKENS = 10000
+
+
+class TokenCache(object):
+    """
+    In-process map from token hashes to the token id and the field values
+    of its user, each entry kept for `timeout` seconds.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, digest):
+        entry = self.entries.get(digest)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, digest, value):
+        with self.lock:
+            if len(self.entries) >= MAX_CACHED_TOKENS:
+                self.entries.clear()
+            self.entries[digest] = (time.monotonic() + self.timeout, value)
+
+    def discard(self, digest):
+        with self.lock:
+            self.entries.pop(digest, None)
+
+    def discard_user(self, user_id):
+        with self.lock:
+            self.entries = {
+                digest: entry for digest, entry in self.entries.items()
+                if entry[1][1]['id'] != user_id
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(TOKEN_CACHE_TIMEOUT)
+
+
+def load_token(digest):
+    try:
+        token = AuthToken.objects.select_related('user').get(digest=digest)
+    except AuthToken.DoesNotExist:
+        raise AuthenticationFailed("Invalid token.")
+    return token.pk, get_user_values(token.user)
+
+
+class CachedTokenAuthentication(BaseAuthentication):
+    """
+    `Authorization: Token <key>` authentication against hashed AuthTokens.
+    Resolved tokens are cached in process, so a repeated key costs a hash
+    and a dictionary lookup. Every request gets its own User instance.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed("Invalid token header.")
+        try:
+            key = auth[1].decode('ascii')
+        except UnicodeError:
+            raise AuthenticationFailed("Invalid token header.")
+
+        digest = hash_token(key)
+        cached = token_cache.get(digest)
+        if cached is None:
+            cached = load_token(digest)
+            token_cache.set(digest, cached)
+
+        token_id, user_values = cached
+        user = build_user(user_values)
+        if not user.is_active:
+            raise AuthenticationFailed("User inactive or deleted.")
+        return user, AuthToken(pk=token_id, user=user, digest=digest)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+USER_CACHE_TIMEOUT = getattr(settings, 'FOOD_POLL_USER_CACHE_TIMEOUT', 300)
+
+
+def user_cache_key(user_id):
+    return 'food_poll:user:%s' % user_id
+
+
+def get_user_values(user):
+    return {field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields}
+
+
+def build_user(values):
+    """
+    Returns a fresh User instance from `get_user_values()` output that
+    saves like one loaded from the database.
+    """
+    user_model = get_user_model()
+    user = user_model(**values)
+    user._state.adding = False
+    user._state.db = user_model._default_manager.db
+    return user
+
+
+def invalidate_users(user_ids):
+    keys = [user_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose `get_user()`, run by AuthenticationMiddleware on
+    every session-authenticated request, reads the user from the cache.
+    Entries are dropped whenever the user is saved or deleted.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            user = super(CachedModelBackend, self).get_user(user_id)
+            if user is None:
+                return None
+            values = get_user_values(user)
+            cache.set(key, values, USER_CACHE_TIMEOUT)
+        user = build_user(values)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,32 @@
+import datetime
+import hashlib
+
+from .menucache import get_restaurants_version
+from .models import Menu
+
+
+def make_etag(request, *stamps):
+    # Hyperlinks in the payloads depend on the scheme and host
+    key = repr((request.build_absolute_uri('/'), request.user.pk) + stamps)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def menu_stamps(request, queryset):
+    return tuple(queryset.with_voted(request.user).order_by('pk').values_list(
+        'pk', 'updated_at', 'voted'))
+
+
+def todays_menus_etag(request, *args, **kwargs):
+    return make_etag(request, menu_stamps(
+        request, Menu.objects.filter(date=datetime.date.today())))
+
+
+def restaurant_today_etag(request, *args, **kwargs):
+    return make_etag(request, menu_stamps(request, Menu.objects.filter(
+        restaurant=kwargs.get('pk'), date=datetime.date.today())))
+
+
+def restaurants_etag(request, *args, **kwargs):
+    # A version bumped by every restaurant write, so a 304 costs a cache
+    # lookup instead of a scan of the restaurant table
+    return make_etag(request, get_restaurants_version())
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.transaction import TransactionManagementError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .routers import LOGS_ALIAS
+
+
+def apply_sqlite_pragmas(connection, pragmas):
+    # Run on the DB-API connection, like Django's own foreign_keys PRAGMA,
+    # so they don't show up in query counts
+    for name, value in pragmas.items():
+        connection.connection.execute('PRAGMA %s = %s' % (name, value))
+
+
+def lock_table(model, using=DEFAULT_DB_ALIAS):
+    """
+    Blocks other writers of `model`'s table until the current transaction
+    ends, so rows read afterwards can't change or appear before it commits.
+    SQLite has a single write lock, which any write statement takes; taking
+    it before the first read also avoids SQLITE_BUSY_SNAPSHOT in WAL mode.
+    Only meant as a fallback where row-level upserts aren't used: on other
+    backends a table lock would stall every concurrent write.
+    """
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        raise TransactionManagementError(
+            "lock_table() must be called inside a transaction")
+    if connection.vendor == 'sqlite':
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE 0 = 1' % table)
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        pragmas = dict(getattr(settings, 'FOOD_POLL_SQLITE_PRAGMAS', {}))
+        if connection.alias == LOGS_ALIAS:
+            # APIRequestLog.user references auth_user, which lives in the
+            # primary
+            pragmas['foreign_keys'] = 'off'
+        if connection.settings_dict['NAME'] in getattr(
+                settings, 'FOOD_POLL_SQLITE_COMMITTED_DATABASES', ()):
+            pragmas.pop('journal_mode', None)
+        apply_sqlite_pragmas(connection, pragmas)
+
+
+def close_thread_connections():
+    """
+    Closes this thread's connections outside of transactions, for threads
+    that use the ORM outside of a request, such as streaming responses.
+    """
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+@receiver(request_started)
+def check_persistent_connections(**kwargs):
+    if not getattr(settings, 'FOOD_POLL_DB_HEALTH_CHECKS', False):
+        return
+    for connection in connections.all():
+        if connection.connection is not None and \
+                not connection.in_atomic_block and \
+                not connection.is_usable():
+            connection.close()
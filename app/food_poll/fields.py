@@ -0,0 +1,60 @@
+import threading
+
+from django.urls import get_script_prefix
+from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+
+PK_MARKER = '__pk__'
+
+MAX_TEMPLATES = 1024
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_url_template(field, view_name, request, format):
+    """
+    The (prefix, suffix) around the pk in the URLs `field` builds for
+    `view_name`. Resolved with `reverse()` once per host, script prefix,
+    API version and format.
+    """
+    key = (
+        view_name, field.lookup_url_kwarg, format, get_script_prefix(),
+        request and request.build_absolute_uri('/'),
+        getattr(request, 'version', None), getattr(request, 'urlconf', None),
+    )
+    template = _templates.get(key)
+    if template is None:
+        url = serializers.HyperlinkedRelatedField.get_url(
+            field, PKOnlyObject(PK_MARKER), view_name, request, format)
+        template = tuple(url.split(PK_MARKER))
+        with _templates_lock:
+            if len(_templates) >= MAX_TEMPLATES:
+                _templates.clear()
+            _templates[key] = template
+    return template
+
+
+class TemplateURLMixin(object):
+    """
+    Builds hyperlinks by formatting the pk into a cached URL template
+    instead of calling `reverse()` for every object.
+    """
+
+    def get_url(self, obj, view_name, request, format):
+        pk = getattr(obj, self.lookup_field, None)
+        if self.lookup_field != 'pk' or not isinstance(pk, int):
+            return super(TemplateURLMixin, self).get_url(
+                obj, view_name, request, format)
+        prefix, suffix = get_url_template(self, view_name, request, format)
+        return '%s%d%s' % (prefix, pk, suffix)
+
+
+class HyperlinkedIdentityField(TemplateURLMixin,
+                               serializers.HyperlinkedIdentityField):
+    pass
+
+
+class HyperlinkedRelatedField(TemplateURLMixin,
+                              serializers.HyperlinkedRelatedField):
+    pass
@@ -1,3 +1,6 @@
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
 
 
 def get_updated_serializer_fields(
@@ -16,3 +19,49 @@ def get_permissions_by_action(
         ]
     except KeyError:
         return [permission() for permission in permission_classes]
+
+
+def get_date_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValidationError({name: ["Enter a valid date (YYYY-MM-DD)."]})
+    return date
+
+
+def get_id_list_param(request, name):
+    """
+    Ids given as repeated (`?name=1&name=2`) or comma separated
+    (`?name=1,2`) query parameters.
+    """
+    values = [value for param in request.query_params.getlist(name)
+              for value in param.split(',') if value.strip()]
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        raise ValidationError({name: ["Enter a list of ids."]})
+
+
+def get_bool_param(request, name):
+    value = request.query_params.get(name, '').lower()
+    if not value:
+        return None
+    if value in ('1', 'true'):
+        return True
+    if value in ('0', 'false'):
+        return False
+    raise ValidationError({name: ["Must be true or false."]})
+
+
+def get_bool_data(request, name):
+    if name not in request.data:
+        return False
+    try:
+        return BooleanField().to_internal_value(request.data[name])
+    except ValidationError:
+        raise ValidationError({name: ["Must be true or false."]})
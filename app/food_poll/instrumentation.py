@@ -0,0 +1,43 @@
+import time
+from collections import Counter
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')
+
+
+class QueryRecorder(object):
+    """
+    Database execute wrapper recording every statement and its duration,
+    see `connection.execute_wrapper()`. Transaction control statements are
+    recorded but left out of `count`.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.statements())
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def statements(self):
+        return [sql for sql, _ in self.queries
+                if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS)]
+
+    def duplicates(self):
+        """
+        Statements that ran more than once with the most frequent first;
+        usually the sign of a query issued per row of a list.
+        """
+        return [(sql, count)
+                for sql, count in Counter(self.statements()).most_common()
+                if count > 1]
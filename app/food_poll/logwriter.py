@@ -0,0 +1,186 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('drop', 'sample', 'block')
+
+
+class BufferedLogWriter(object):
+    """
+    Collects log model instances in a bounded queue and writes them with
+    `bulk_create` from a background thread, once `batch_size` records are
+    waiting or `flush_interval` seconds have passed.
+
+    When the queue is full, `policy` decides what happens to new records:
+    'drop' discards them, 'block' waits up to `block_timeout` seconds for
+    free space before dropping them and 'sample' keeps only `sample_rate`
+    of the records once the queue is half full.
+    """
+
+    def __init__(self, model, batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, policy='drop', sample_rate=0.1,
+                 block_timeout=1.0):
+        if policy not in POLICIES:
+            raise ValueError("Unknown log buffer policy %r" % policy)
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'written': 0,
+            'failed': 0,
+            'dropped': 0,
+            'sampled_out': 0,
+            'batches': 0,
+            'last_flush_ms': None,
+            'max_flush_ms': None,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.run, name='food-poll-log-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def submit(self, record):
+        if self.policy == 'block':
+            # Nothing drains a full queue without a running writer thread
+            timeout = self.block_timeout if self.is_alive() else 0
+            try:
+                self.queue.put(record, timeout=timeout)
+            except queue.Full:
+                logger.warning('API log queue is full, dropping a record')
+                self._count('dropped')
+                return False
+            return True
+
+        if self.policy == 'sample' and \
+                self.queue.qsize() * 2 >= self.queue.maxsize and \
+                random.random() >= self.sample_rate:
+            self._count('sampled_out')
+            return False
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        return True
+
+    def is_alive(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def run(self):
+        try:
+            while not self._stopped.is_set():
+                batch = self._take_batch()
+                if batch:
+                    self.write(batch)
+        finally:
+            connection.close()
+
+    def flush(self):
+        while True:
+            batch = self._take_batch(timeout=0)
+            if not batch:
+                return
+            self.write(batch)
+
+    def write(self, batch):
+        started = time.perf_counter()
+        try:
+            self.model._default_manager.bulk_create(batch)
+        except Exception:
+            logger.exception('Writing %d API log records failed', len(batch))
+            self._count('failed', len(batch))
+            return
+        flush_ms = (time.perf_counter() - started) * 1000
+
+        with self._stats_lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['last_flush_ms'] = flush_ms
+            self._stats['max_flush_ms'] = max(
+                flush_ms, self._stats['max_flush_ms'] or 0)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'policy': self.policy,
+            'queued': self.queue.qsize(),
+            'max_queue_size': self.queue.maxsize,
+        })
+        return stats
+
+    def _take_batch(self, timeout=None):
+        if timeout is None:
+            timeout = self.flush_interval
+        deadline = time.monotonic() + timeout
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    global _writer
+
+    if getattr(settings, 'FOOD_POLL_LOG_MODE', 'sync') != 'buffered':
+        return None
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                from rest_framework_tracking.models import APIRequestLog
+
+                options = getattr(settings, 'FOOD_POLL_LOG_BUFFER', {})
+                writer = BufferedLogWriter(
+                    APIRequestLog,
+                    batch_size=options.get('BATCH_SIZE', 100),
+                    flush_interval=options.get('FLUSH_INTERVAL', 1.0),
+                    max_queue_size=options.get('MAX_QUEUE_SIZE', 10000),
+                    policy=options.get('POLICY', 'drop'),
+                    sample_rate=options.get('SAMPLE_RATE', 0.1),
+                    block_timeout=options.get('BLOCK_TIMEOUT', 1.0))
+                writer.start()
+                atexit.register(writer.stop)
+                _writer = writer
+    return _writer
@@ -0,0 +1,170 @@
+import asyncio
+import datetime
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import reverse
+
+from food_poll.asgi import ASGIHandler
+from food_poll.models import AuthToken, Profile, Restaurant
+from food_poll.seed import benchmark_database, seed_database, \
+    write_results
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(latencies),
+        'statuses': {str(code): count for code, count in statuses.items()},
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(statistics.median(latencies), 3),
+            'p95': round(latencies[int(len(latencies) * 0.95)], 3),
+            'max': round(latencies[-1], 3),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Compares serving the hot read endpoints through WSGI and ASGI " \
+           "to many concurrent, slow clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=64,
+                            help="Concurrent client connections")
+        parser.add_argument('--workers', type=int, default=8,
+                            help="WSGI worker threads and ASGI view threads")
+        parser.add_argument('--requests', type=int, default=10,
+                            help="Requests per connection")
+        parser.add_argument('--client-delay', type=float, default=50,
+                            help="Milliseconds a client takes to receive "
+                                 "a response")
+        parser.add_argument('--output',
+                            help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            results = self.run(options)
+        write_results(results, options['output'])
+
+    def run(self, options):
+        seed_database(restaurants=20, days=2,
+                      employees=options['connections'], log_entries=0)
+        restaurant = Restaurant.objects.filter(
+            menu__date=datetime.date.today()).first()
+        self.paths = [reverse('menu-today'), reverse('menu-results'),
+                      reverse('restaurant-today', args=[restaurant.pk])]
+        self.keys = [
+            AuthToken.objects.issue(profile.user)[1]
+            for profile in Profile.objects.select_related('user').filter(
+                employee=True)[:options['connections']]]
+
+        results = {}
+        for name, measure in (('wsgi', self.measure_wsgi),
+                              ('asgi', self.measure_asgi)):
+            results[name] = measure(options)
+            connections.close_all()
+            self.stdout.write(
+                "%-5s %8.1f req/s  p50 %7.1f ms  p95 %7.1f ms  %s" % (
+                    name, results[name]['requests_per_second'],
+                    results[name]['latency_ms']['p50'],
+                    results[name]['latency_ms']['p95'],
+                    results[name]['statuses']))
+        return results
+
+    def requests(self, index, options):
+        key = self.keys[index % len(self.keys)]
+        for number in range(options['requests']):
+            yield self.paths[(index + number) % len(self.paths)], key
+
+    def measure_wsgi(self, options):
+        """
+        A sync server: each request holds one of `workers` threads until
+        the client has received the response.
+        """
+        application = get_wsgi_application()
+        factory = RequestFactory()
+        workers = threading.BoundedSemaphore(options['workers'])
+        delay = options['client_delay'] / 1000
+        latencies, statuses, lock = [], Counter(), threading.Lock()
+
+        def client(index):
+            own = []
+            for path, key in self.requests(index, options):
+                environ = factory.get(
+                    path, HTTP_AUTHORIZATION='Token ' + key).environ
+                started = time.perf_counter()
+                with workers:
+                    response = application(environ, lambda *args: None)
+                    b''.join(response)
+                    response.close()
+                    time.sleep(delay)
+                own.append(time.perf_counter() - started)
+                with lock:
+                    statuses[response.status_code] += 1
+            with lock:
+                latencies.extend(own)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(index,))
+                   for index in range(options['connections'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, statuses, time.perf_counter() - started)
+
+    def measure_asgi(self, options):
+        handler = ASGIHandler(get_wsgi_application(),
+                              threads=options['workers'])
+        delay = options['client_delay'] / 1000
+        latencies, statuses = [], Counter()
+
+        async def request(path, key):
+            sent = asyncio.Event()
+
+            async def receive():
+                if not sent.is_set():
+                    sent.set()
+                    return {'type': 'http.request', 'body': b''}
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses[message['status']] += 1
+                elif message['type'] == 'http.response.body' and \
+                        not message.get('more_body'):
+                    await asyncio.sleep(delay)
+
+            await handler({
+                'type': 'http', 'method': 'GET', 'path': path,
+                'query_string': b'', 'server': ('testserver', 80),
+                'client': ('127.0.0.1', 50000),
+                'headers': [(b'host', b'testserver'),
+                            (b'authorization', b'Token ' + key.encode())],
+            }, receive, send)
+
+        async def client(index):
+            for path, key in self.requests(index, options):
+                started = time.perf_counter()
+                await request(path, key)
+                latencies.append(time.perf_counter() - started)
+
+        async def main():
+            await asyncio.gather(*[
+                client(index) for index in range(options['connections'])])
+
+        started = time.perf_counter()
+        try:
+            asyncio.run(main())
+        finally:
+            handler.executor.shutdown()
+            handler.stream_executor.shutdown()
+        return summarize(latencies, statuses, time.perf_counter() - started)
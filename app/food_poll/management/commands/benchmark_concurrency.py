@@ -0,0 +1,206 @@
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from food_poll.mixins import ConfiguredLoggingMixin
+from food_poll.models import Menu
+from food_poll.routers import LOGS_ALIAS
+from food_poll.seed import benchmark_database, seed_database, \
+    write_results
+
+# Settings the workload runs with; 'tuned' is the configured database, the
+# others change one thing about it. 'logging' False turns request logging
+# off, 'logs_database' writes request logs to a separate database
+PROFILES = {
+    'untuned': {
+        'FOOD_POLL_SQLITE_PRAGMAS': {
+            'journal_mode': 'delete',
+            'synchronous': 'full',
+        },
+        'CONN_MAX_AGE': 0,
+    },
+    'tuned': {},
+    'no-logging': {'logging': False},
+    'logs-db': {'logs_database': True},
+}
+
+
+@contextmanager
+def request_logging(enabled):
+    logging_methods = ConfiguredLoggingMixin.logging_methods
+    if not enabled:
+        ConfiguredLoggingMixin.logging_methods = []
+    try:
+        yield
+    finally:
+        ConfiguredLoggingMixin.logging_methods = logging_methods
+
+
+@contextmanager
+def logs_database(enabled):
+    """
+    Routes request logs to a throwaway 'logs' database for the block.
+    """
+    if not enabled:
+        yield
+        return
+
+    handle, name = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(handle)
+    connections.databases[LOGS_ALIAS] = dict(
+        connections.databases[DEFAULT_DB_ALIAS], NAME=name)
+    try:
+        call_command('migrate', database=LOGS_ALIAS, verbosity=0,
+                     interactive=False)
+        connections[LOGS_ALIAS].close()
+        yield
+    finally:
+        connections[LOGS_ALIAS].close()
+        del connections[LOGS_ALIAS]
+        del connections.databases[LOGS_ALIAS]
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(name + suffix):
+                os.remove(name + suffix)
+
+
+class Command(BaseCommand):
+    help = "Measures throughput of concurrent votes and menu reads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--write-ratio', type=float, default=0.3,
+                            help="Share of requests that vote")
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--employees', type=int, default=200)
+        parser.add_argument('--profile', action='append',
+                            choices=sorted(PROFILES),
+                            help="Profile to run, repeatable (default: all)")
+        parser.add_argument('--output',
+                            help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            # Log entries stay in the throwaway database unless a profile
+            # asks for a separate one
+            logs_settings = connections.databases.pop(LOGS_ALIAS, None)
+            try:
+                results = self.run(options)
+            finally:
+                if logs_settings is not None:
+                    connections.databases[LOGS_ALIAS] = logs_settings
+        write_results(results, options['output'])
+
+    def run(self, options):
+        seed_database(restaurants=options['restaurants'], days=1,
+                      employees=options['employees'], log_entries=0)
+        users = list(User.objects.filter(username__startswith='employee_'))
+        menu_ids = list(Menu.objects.filter(
+            date=datetime.date.today()).values_list('id', flat=True))
+
+        results = {}
+        for name in options['profile'] or list(PROFILES):
+            profile = dict(PROFILES[name])
+            max_age = profile.pop('CONN_MAX_AGE', None)
+            logging = profile.pop('logging', True)
+            separate_logs = profile.pop('logs_database', False)
+            database = connections.databases[connection.alias]
+            configured_max_age = database['CONN_MAX_AGE']
+            if max_age is not None:
+                database['CONN_MAX_AGE'] = max_age
+            try:
+                with override_settings(**profile), \
+                        request_logging(logging), \
+                        logs_database(separate_logs):
+                    # New connections pick up the profile's PRAGMAs
+                    connection.close()
+                    results[name] = self.measure(users, menu_ids, options)
+            finally:
+                database['CONN_MAX_AGE'] = configured_max_age
+            self.stdout.write(
+                "%-10s %8.1f req/s %8.1f votes/s  p50 %6.1f ms  "
+                "p95 %6.1f ms  %d errors" % (
+                    name, results[name]['requests_per_second'],
+                    results[name]['votes_per_second'],
+                    results[name]['latency_ms']['p50'],
+                    results[name]['latency_ms']['p95'],
+                    sum(results[name]['errors'].values())))
+        return results
+
+    def measure(self, users, menu_ids, options):
+        deadline = time.perf_counter() + options['seconds']
+        latencies, votes, errors = [], [0], Counter()
+        lock = threading.Lock()
+        today_url = reverse('menu-today')
+
+        def work(index):
+            rng = random.Random(index)
+            client = APIClient()
+            client.force_authenticate(users[index % len(users)])
+            own_latencies, own_votes = [], 0
+            try:
+                while time.perf_counter() < deadline:
+                    vote = rng.random() < options['write_ratio']
+                    started = time.perf_counter()
+                    try:
+                        if vote:
+                            response = client.post(reverse(
+                                'menu-vote', args=[rng.choice(menu_ids)]))
+                        else:
+                            response = client.get(today_url)
+                    except Exception as error:
+                        with lock:
+                            errors[type(error).__name__ + ': ' +
+                                   str(error)] += 1
+                        continue
+                    if response.status_code >= 400:
+                        with lock:
+                            errors['HTTP %d' % response.status_code] += 1
+                        continue
+                    own_latencies.append(time.perf_counter() - started)
+                    own_votes += vote
+            finally:
+                connections.close_all()
+                with lock:
+                    latencies.extend(own_latencies)
+                    votes[0] += own_votes
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=work, args=(index,))
+                   for index in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        requests = len(latencies)
+        latencies = sorted(latency * 1000 for latency in latencies) or [0]
+        return {
+            'threads': options['threads'],
+            'write_ratio': options['write_ratio'],
+            'seconds': round(elapsed, 3),
+            'requests': requests,
+            'requests_per_second': round(requests / elapsed, 1),
+            'votes_per_second': round(votes[0] / elapsed, 1),
+            'latency_ms': {
+                'p50': round(statistics.median(latencies), 3),
+                'p95': round(latencies[int(len(latencies) * 0.95)], 3),
+                'max': round(latencies[-1], 3),
+            },
+            'errors': dict(errors),
+        }
@@ -0,0 +1,217 @@
+import datetime
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from food_poll.instrumentation import QueryRecorder
+from food_poll.models import Menu, Profile, Restaurant
+from food_poll.seed import benchmark_database, seed_database, \
+    write_results
+from food_poll.urls import router
+
+# Most SQL statements a single request to an endpoint may issue
+QUERY_BUDGETS = {
+    'restaurant-list': 3,
+    'restaurant-detail': 3,
+    'restaurant-today': 4,
+    'menu-list': 4,
+    'menu-detail': 4,
+    'menu-today': 4,
+    'menu-results': 5,
+    'menu-vote': 6,
+    'menu-votes-batch': 10,
+    'menu-bulk': 8,
+    'menu-search': 4,
+    'menuvote-list': 3,
+    'menuvote-detail': 3,
+    'dailyresult-list': 3,
+    'dailyresult-detail': 3,
+    'dailyresult-winners': 3,
+    'user-list': 4,
+    'user-detail': 4,
+    'profile-list': 4,
+    'profile-detail': 4,
+    'apirequestlog-list': 3,
+    'apirequestlog-detail': 3,
+    'apirequestlog-writer': 3,
+}
+
+ROLES = ('admin', 'employee')
+
+
+def get_payloads():
+    menu = Menu.objects.filter(date=datetime.date.today()).first()
+    restaurant = Restaurant.objects.order_by('pk').first()
+    return {
+        'menu-vote': {},
+        'menu-search': {'q': 'spicy ramen'},
+        'menu-votes-batch': [{'menu': menu.pk, 'voted': True}],
+        'menu-bulk': [{
+            'restaurant': restaurant.pk,
+            'date': datetime.date.today() + datetime.timedelta(days=30),
+            'description': "Benchmark menu"
+        }],
+    }
+
+
+def get_endpoints():
+    """
+    Yields (name, method, url) for every route of the food_poll router.
+    """
+    today_menu = Menu.objects.filter(date=datetime.date.today()).first()
+    for prefix, viewset, basename in router.registry:
+        model = viewset.queryset.model
+        if model is Menu and today_menu:
+            pk = today_menu.pk
+        else:
+            pk = model._default_manager.order_by('pk').values_list(
+                'pk', flat=True).first()
+
+        yield basename + '-list', 'get', reverse(basename + '-list')
+        if pk is not None:
+            yield basename + '-detail', 'get', reverse(
+                basename + '-detail', kwargs={'pk': pk})
+
+        for action in viewset.get_extra_actions():
+            name = basename + '-' + action.url_name
+            if action.detail:
+                if pk is None:
+                    continue
+                url = reverse(name, kwargs={'pk': pk})
+            else:
+                url = reverse(name)
+            for method in action.mapping:
+                yield name, method, url
+
+
+class Command(BaseCommand):
+    help = "Seeds a throwaway database and measures every API endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--days', type=int, default=5 * 365)
+        parser.add_argument('--employees', type=int, default=5000)
+        parser.add_argument('--log-entries', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Requests per endpoint and role")
+        parser.add_argument('--output',
+                            help="Write the results as JSON to this file")
+        parser.add_argument('--baseline',
+                            help="JSON results of an earlier run to compare")
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Seed the configured database instead of "
+                                 "a throwaway test database")
+
+    def handle(self, *args, **options):
+        with benchmark_database(options['use_current_db']):
+            results = self.run(options)
+        write_results(results, options['output'])
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                self.compare(json.load(baseline), results)
+
+        over_budget = [
+            '%s (%s): %d queries, budget %d' % (
+                name, role, measurement['queries'], QUERY_BUDGETS[name])
+            for name, roles in sorted(results['endpoints'].items())
+            for role, measurement in roles.items()
+            if name in QUERY_BUDGETS and
+            measurement['queries'] > QUERY_BUDGETS[name]
+        ]
+        if over_budget:
+            raise CommandError(
+                "Query budget exceeded:\n" + "\n".join(over_budget))
+
+    def run(self, options):
+        started = time.perf_counter()
+        seed_database(
+            restaurants=options['restaurants'], days=options['days'],
+            employees=options['employees'],
+            log_entries=options['log_entries'],
+            log=lambda message: self.stdout.write(message))
+        seed_seconds = time.perf_counter() - started
+
+        clients = {}
+        for role in ROLES:
+            user = User.objects.create(username='benchmark_' + role,
+                                       is_superuser=role == 'admin',
+                                       is_staff=role == 'admin')
+            Profile.objects.create(user=user, employee=True)
+            clients[role] = APIClient()
+            clients[role].force_authenticate(user)
+
+        payloads = get_payloads()
+        results = {
+            'meta': {
+                'restaurants': options['restaurants'],
+                'days': options['days'],
+                'employees': options['employees'],
+                'log_entries': options['log_entries'],
+                'repeat': options['repeat'],
+                'seed_seconds': round(seed_seconds, 3),
+                'vendor': connection.vendor,
+            },
+            'endpoints': {},
+        }
+
+        for name, method, url in get_endpoints():
+            if method != 'get' and name not in payloads:
+                self.stdout.write("Skipping %s %s" % (method.upper(), url))
+                continue
+            for role in ROLES:
+                measurement = self.measure(
+                    clients[role], method, url, payloads.get(name),
+                    options['repeat'])
+                results['endpoints'].setdefault(name, {})[role] = measurement
+                self.stdout.write(
+                    "%-20s %-8s %-4s %6.1f ms %4d queries %6.1f ms SQL" % (
+                        name, role, measurement['status'],
+                        measurement['wall_ms']['median'],
+                        measurement['queries'], measurement['sql_ms']))
+        return results
+
+    def measure(self, api_client, method, url, data, repeat):
+        wall, sql, queries = [], [], 0
+        for _ in range(repeat):
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                started = time.perf_counter()
+                response = getattr(api_client, method)(url, data,
+                                                       format='json')
+                wall.append((time.perf_counter() - started) * 1000)
+            sql.append(recorder.duration * 1000)
+            queries = max(queries, recorder.count)
+
+        return {
+            'method': method.upper(),
+            'url': url,
+            'status': response.status_code,
+            'queries': queries,
+            'sql_ms': round(statistics.median(sql), 3),
+            'wall_ms': {
+                'median': round(statistics.median(wall), 3),
+                'min': round(min(wall), 3),
+                'max': round(max(wall), 3),
+            },
+        }
+
+    def compare(self, baseline, results):
+        self.stdout.write("\n%-20s %-8s %12s %12s" % (
+            'endpoint', 'role', 'wall ms', 'queries'))
+        for name, roles in sorted(results['endpoints'].items()):
+            for role, measurement in sorted(roles.items()):
+                before = baseline.get('endpoints', {}).get(name, {}).get(role)
+                if not before:
+                    continue
+                self.stdout.write("%-20s %-8s %+11.1f%% %+12d" % (
+                    name, role,
+                    (measurement['wall_ms']['median'] /
+                     max(before['wall_ms']['median'], 0.001) - 1) * 100,
+                    measurement['queries'] - before['queries']))
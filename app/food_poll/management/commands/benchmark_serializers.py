@@ -0,0 +1,89 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework_tracking.models import APIRequestLog
+
+from food_poll.models import Menu, MenuVote
+from food_poll.seed import benchmark_database, seed_database
+from food_poll.serializers import LogEntrySerializer, MenuSerializer, \
+    MenuVoteSerializer, ValuesSerializer
+from food_poll.views import menuview_fields
+
+DAYS = 100
+
+
+class Command(BaseCommand):
+    help = "Compares rendering large lists with the model serializers and " \
+           "with ValuesSerializer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000,
+                            help="Rows rendered per list")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Seed the configured database instead of "
+                                 "a throwaway test database")
+
+    def handle(self, *args, **options):
+        with benchmark_database(options['use_current_db']):
+            self.run(options)
+
+    def run(self, options):
+        rows = options['rows']
+        per_day = -(-rows // DAYS)
+        seed_database(restaurants=per_day, days=DAYS, employees=per_day,
+                      log_entries=rows,
+                      log=lambda message: self.stdout.write(message))
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.filter(
+            username__startswith='employee_').first()
+        cases = (
+            ('menus', Menu.objects.for_fields(
+                request.user, menuview_fields).order_by('date', 'id'),
+             MenuSerializer, {'fields': menuview_fields}),
+            ('menuvotes', MenuVote.objects.order_by('id'),
+             MenuVoteSerializer, {}),
+            ('log_entries', APIRequestLog.objects.select_related(
+                None).order_by('-requested_at', '-id'),
+             LogEntrySerializer, {}),
+        )
+
+        self.stdout.write("%-12s %8s %12s %12s %8s" % (
+            'list', 'rows', 'model ms', 'values ms', 'speedup'))
+        for name, queryset, serializer_class, context in cases:
+            context = dict(context, request=request)
+            queryset = queryset[:rows]
+
+            def render_models():
+                return JSONRenderer().render(serializer_class(
+                    queryset, many=True, context=context).data)
+
+            def render_values():
+                serializer = ValuesSerializer(
+                    serializer_class(context=context))
+                return JSONRenderer().render(serializer.to_representation(
+                    serializer.values(queryset)))
+
+            model_ms, model_output = self.measure(
+                render_models, options['repeat'])
+            values_ms, values_output = self.measure(
+                render_values, options['repeat'])
+            if model_output != values_output:
+                raise CommandError("%s: outputs differ" % name)
+
+            self.stdout.write("%-12s %8d %12.1f %12.1f %7.1fx" % (
+                name, queryset.count(), model_ms, values_ms,
+                model_ms / max(values_ms, 0.001)))
+
+    def measure(self, render, repeat):
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = render()
+            durations.append((time.perf_counter() - started) * 1000)
+        return statistics.median(durations), output
@@ -0,0 +1,61 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils.dateparse import parse_date
+
+from food_poll.models import DailyResult, Menu
+
+
+def date_argument(value):
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+class Command(BaseCommand):
+    help = "Stores the ranked vote counts of finished days in DailyResult"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date_argument,
+                            help="Close this day instead of yesterday")
+        parser.add_argument('--from', dest='start', type=date_argument,
+                            help="First day of a range to backfill")
+        parser.add_argument('--to', dest='end', type=date_argument,
+                            help="Last day of the range, yesterday if omitted")
+        parser.add_argument('--all', action='store_true',
+                            help="Backfill every day up to yesterday")
+        parser.add_argument('--chunk-days', type=int, default=31,
+                            help="Days closed per transaction")
+
+    def handle(self, *args, **options):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        if options['date']:
+            start = end = options['date']
+        elif options['all']:
+            start = Menu.objects.aggregate(start=Min('date'))['start']
+            end = options['end'] or yesterday
+            if start is None:
+                self.stdout.write("No menus to close")
+                return
+        elif options['start']:
+            start, end = options['start'], options['end'] or yesterday
+        else:
+            start = end = yesterday
+
+        if start > end:
+            raise CommandError("--from must not be after --to")
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+
+        chunk = datetime.timedelta(days=options['chunk_days'])
+        total = 0
+        while start <= end:
+            chunk_end = min(start + chunk - datetime.timedelta(days=1), end)
+            closed = DailyResult.objects.close_days(start, chunk_end)
+            total += closed
+            self.stdout.write("Closed %s to %s: %d results" % (
+                start, chunk_end, closed))
+            start = chunk_end + datetime.timedelta(days=1)
+        self.stdout.write("Stored %d results" % total)
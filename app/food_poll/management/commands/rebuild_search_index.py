@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from food_poll import search
+
+NEW_TABLE = search.SEARCH_TABLE + '_new'
+
+# The last menu id the new index holds; its triggers maintain menus up to
+# it and the chunks index the rest
+COPIED_TABLE = search.SEARCH_TABLE + '_copied'
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over menu descriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Menus indexed per transaction")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        connection = connections[options['database']]
+        with transaction.atomic(using=connection.alias):
+            search.install(connection)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("REINDEX INDEX %s" % search.SEARCH_TABLE)
+            self.stdout.write("Reindexed %s" % search.SEARCH_TABLE)
+            return
+        if connection.vendor != 'sqlite':
+            self.stdout.write("No search index on %s" % connection.vendor)
+            return
+
+        # A new index is filled next to the live one, one short transaction
+        # per chunk, so votes and menu writes only ever wait for one chunk.
+        # Searches use the old index until the new one replaces it
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            self.drop_new_index(cursor)
+            cursor.execute("CREATE TABLE %s (id integer NOT NULL)" %
+                           COPIED_TABLE)
+            cursor.execute("INSERT INTO %s (id) VALUES (0)" % COPIED_TABLE)
+            for statement in search.sqlite_schema(NEW_TABLE, COPIED_TABLE):
+                cursor.execute(statement)
+
+        total = 0
+        while True:
+            with transaction.atomic(using=connection.alias), \
+                    connection.cursor() as cursor:
+                start, end, indexed = self.index_chunk(
+                    cursor, options['chunk_size'])
+            if start == end:
+                break
+            total += indexed
+            self.stdout.write("Indexed %d menus up to id %d" % (
+                indexed, end))
+
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            # Menus created after the last chunk
+            total += self.index_chunk(cursor, None)[2]
+            for statement in search.sqlite_drop(search.SEARCH_TABLE):
+                cursor.execute(statement)
+            self.drop_new_index(cursor, keep_table=True)
+            cursor.execute("ALTER TABLE %s RENAME TO %s" % (
+                NEW_TABLE, search.SEARCH_TABLE))
+            search.install(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO %s(%s) VALUES ('optimize')" % (
+                    search.SEARCH_TABLE, search.SEARCH_TABLE))
+        self.stdout.write("Indexed %d menus" % total)
+
+    def index_chunk(self, cursor, size):
+        """
+        Indexes the next `size` menus, or all remaining ones; returns the
+        range of ids covered and the number of menus indexed.
+        """
+        # Writing first takes the write lock before anything is read, which
+        # avoids SQLITE_BUSY_SNAPSHOT
+        cursor.execute("UPDATE %s SET id = id" % COPIED_TABLE)
+        cursor.execute("SELECT id FROM %s" % COPIED_TABLE)
+        start, = cursor.fetchone()
+        cursor.execute(
+            "SELECT MAX(id) FROM (SELECT id FROM food_poll_menu "
+            "WHERE id > %s ORDER BY id LIMIT %s)", [start, size or -1])
+        end = cursor.fetchone()[0]
+        if end is None:
+            return start, start, 0
+
+        cursor.execute(
+            "INSERT INTO %s(rowid, description) "
+            "SELECT id, description FROM food_poll_menu "
+            "WHERE id > %%s AND id <= %%s" % NEW_TABLE, [start, end])
+        indexed = cursor.rowcount
+        cursor.execute("UPDATE %s SET id = %%s" % COPIED_TABLE, [end])
+        return start, end, indexed
+
+    def drop_new_index(self, cursor, keep_table=False):
+        for statement in search.sqlite_drop(NEW_TABLE):
+            if not (keep_table and statement.startswith('DROP TABLE')):
+                cursor.execute(statement)
+        cursor.execute("DROP TABLE IF EXISTS %s" % COPIED_TABLE)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from food_poll.models import Menu
+
+
+class Command(BaseCommand):
+    help = "Recomputes Menu.totalvotes from the MenuVote table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Only rebuild menus of this date")
+
+    def handle(self, *args, **options):
+        queryset = Menu.objects.all()
+        if options['date']:
+            queryset = queryset.filter(date=options['date'])
+        updated = queryset.rebuild_totalvotes()
+        self.stdout.write("Rebuilt vote counts for %d menus" % updated)
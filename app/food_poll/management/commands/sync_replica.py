@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from food_poll.routers import REPLICA_ALIAS, replica_configured
+
+
+def copy_sqlite(source, target):
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+class Command(BaseCommand):
+    help = "Copies the primary SQLite database to the read replica"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Keep copying, waiting this many seconds "
+                                 "between copies")
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError(
+                "No replica configured, set FOOD_POLL_DB_REPLICA")
+        primary = connections[DEFAULT_DB_ALIAS]
+        replica = connections[REPLICA_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError(
+                "Only SQLite replicas are copied, use the database's own "
+                "replication for %s" % primary.vendor)
+
+        while True:
+            started = time.perf_counter()
+            copy_sqlite(primary, replica)
+            self.stdout.write("Copied %s to %s in %.1f ms" % (
+                primary.settings_dict['NAME'], replica.settings_dict['NAME'],
+                (time.perf_counter() - started) * 1000))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import read_from
+
+MENU_CACHE_TIMEOUT = getattr(settings, 'FOOD_POLL_MENU_CACHE_TIMEOUT', 300)
+
+VERSION_KEY = 'food_poll:menus:version'
+
+RESTAURANTS_VERSION_KEY = 'food_poll:restaurants:version'
+
+
+def _initial_version():
+    # Not 1, so a lost counter can't bring back payloads of an old version
+    return int(time.time() * 1000)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _increment_version(key=VERSION_KEY):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def _increment_on_commit(key):
+    """
+    Increments `key` once the current transaction commits, however many
+    writes in it ask for that.
+    """
+    connection = transaction.get_connection()
+    if any(getattr(callback, 'version_key', None) == key
+           for _, callback in connection.run_on_commit):
+        return
+
+    def increment():
+        _increment_version(key)
+    increment.version_key = key
+    transaction.on_commit(increment)
+
+
+def get_menu_version():
+    return _get_version(VERSION_KEY)
+
+
+def bump_menu_version():
+    """
+    Invalidates every cached menu payload once a Menu write commits. Votes
+    aren't part of the cached payload and don't invalidate it.
+    """
+    _increment_on_commit(VERSION_KEY)
+
+
+def get_restaurants_version():
+    return _get_version(RESTAURANTS_VERSION_KEY)
+
+
+def bump_restaurants_version():
+    """
+    Changes the ETag of /restaurants/ once a Restaurant write commits.
+    """
+    _increment_on_commit(RESTAURANTS_VERSION_KEY)
+
+
+def menu_cache_key(name, date, is_admin, base_url):
+    return 'food_poll:menus:%s:%s:%s:%s:%s' % (
+        name, date.isoformat(), 'admin' if is_admin else 'user',
+        get_menu_version(), base_url)
+
+
+def get_or_build(key, build):
+    data = cache.get(key)
+    if data is None:
+        # Every user gets this payload, so don't let a lagging replica cache
+        # stale rows under the current version
+        with read_from(False):
+            data = build()
+        cache.set(key, data, MENU_CACHE_TIMEOUT)
+    return data
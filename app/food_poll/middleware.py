@@ -0,0 +1,61 @@
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .instrumentation import QueryRecorder
+from .timing import RequestTiming
+
+MAX_DUPLICATES = 10
+
+MAX_SQL_LENGTH = 200
+
+
+def format_server_timing(timing, recorder, total):
+    metrics = ['db;dur=%.2f;desc="%d queries"' % (
+        recorder.duration * 1000, recorder.count)]
+    metrics.extend('%s;dur=%.2f' % (name, duration * 1000)
+                   for name, duration in timing.phases.items())
+    metrics.append('total;dur=%.2f' % (total * 1000))
+    return ', '.join(metrics)
+
+
+def format_duplicates(duplicates):
+    return ' | '.join(
+        '%dx %s' % (count, re.sub(r'\s+', ' ', sql)[:MAX_SQL_LENGTH])
+        for sql, count in duplicates[:MAX_DUPLICATES])
+
+
+class ServerTimingMiddleware(object):
+    """
+    Adds a `Server-Timing` header with the number and duration of SQL
+    statements and the time spent in each request phase recorded through
+    `food_poll.timing.timed()`. With FOOD_POLL_SERVER_TIMING_DUPLICATES,
+    statements that ran more than once are listed in `X-Duplicate-Queries`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'FOOD_POLL_SERVER_TIMING', False):
+            return self.get_response(request)
+
+        request.server_timing = RequestTiming()
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = format_server_timing(
+            request.server_timing, recorder, total)
+        if getattr(settings, 'FOOD_POLL_SERVER_TIMING_DUPLICATES', False):
+            duplicates = recorder.duplicates()
+            if duplicates:
+                response['X-Duplicate-Queries'] = format_duplicates(duplicates)
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_votes(apps, schema_editor):
+    Menu = apps.get_model('food_poll', 'Menu')
+    MenuVote = apps.get_model('food_poll', 'MenuVote')
+    votes = MenuVote.objects.filter(menu=OuterRef('pk')).order_by() \
+        .values('menu').annotate(count=Count('pk')).values('count')
+    Menu.objects.update(totalvotes=Coalesce(
+        Subquery(votes, output_field=models.IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_poll', '0019_auto_20190414_2248'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menu',
+            name='totalvotes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+LOG_INDEX = 'food_poll_apirequestlog_requested_at_id'
+
+
+def create_log_index(apps, schema_editor):
+    APIRequestLog = apps.get_model('rest_framework_tracking',
+                                   'APIRequestLog')
+    quote_name = schema_editor.quote_name
+    schema_editor.execute('CREATE INDEX %s ON %s (%s, %s)' % (
+        quote_name(LOG_INDEX), quote_name(APIRequestLog._meta.db_table),
+        quote_name('requested_at'), quote_name('id')))
+
+
+def drop_log_index(apps, schema_editor):
+    APIRequestLog = apps.get_model('rest_framework_tracking',
+                                   'APIRequestLog')
+    schema_editor.execute(schema_editor.sql_delete_index % {
+        'name': schema_editor.quote_name(LOG_INDEX),
+        'table': schema_editor.quote_name(APIRequestLog._meta.db_table),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_poll', '0020_menu_totalvotes'),
+        ('rest_framework_tracking', '0007_merge_20180419_1646'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(fields=['date', 'id'], name='food_poll_menu_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='menuvote',
+            index=models.Index(fields=['user', 'menu'], name='food_poll_menuvote_user_menu'),
+        ),
+        # Matches the (requested_at, id) keyset ordering of /log_entries/
+        migrations.RunPython(create_log_index, drop_log_index,
+                             hints={'model_name': 'apirequestlog'}),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_poll', '0022_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('votes', models.PositiveIntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('menu', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='food_poll.Menu')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='food_poll.Restaurant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailyresult',
+            index=models.Index(fields=['date', 'rank'], name='food_poll_dailyresult_rank'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyresult',
+            unique_together={('date', 'restaurant')},
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from food_poll import search
+
+
+def install_search_index(apps, schema_editor):
+    search.install(schema_editor.connection)
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "INSERT INTO food_poll_menu_search(food_poll_menu_search) "
+            "VALUES ('rebuild')")
+
+
+def uninstall_search_index(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_poll', '0024_authtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index,
+                             hints={'model_name': 'menu'}),
+    ]
@@ -1,4 +1,15 @@
+import json
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
 from rest_framework_tracking.mixins import LoggingMixin
+from rest_framework_tracking.models import APIRequestLog
+
+from .logwriter import get_log_writer
+from .routers import is_sticky, read_from, replica_configured, \
+    stick_to_primary, use_replica
+from .serializers import ValuesSerializer
+from .timing import timed
 
 
 class ConfiguredLoggingMixin(LoggingMixin):
@@ -7,3 +18,93 @@ class ConfiguredLoggingMixin(LoggingMixin):
     def should_log(self, request, response):
         return request.method in self.logging_methods \
                or response.status_code >= 400
+
+    def _clean_data(self, data):
+        # Responses are logged as rendered JSON, which the base class leaves
+        # unmasked; parse it so issued tokens and the like are masked too
+        if isinstance(data, bytes):
+            data = data.decode()
+        if isinstance(data, str) and data[:1] in ('{', '['):
+            try:
+                parsed = json.loads(data)
+            except ValueError:
+                parsed = None
+            if parsed is not None:
+                cleaned = super(ConfiguredLoggingMixin, self)._clean_data(
+                    parsed)
+                return data if cleaned == parsed else json.dumps(cleaned)
+        return super(ConfiguredLoggingMixin, self)._clean_data(data)
+
+    def handle_log(self):
+        with timed(self.request, 'log'):
+            writer = get_log_writer()
+            if writer is None:
+                return super(ConfiguredLoggingMixin, self).handle_log()
+            writer.submit(APIRequestLog(**self.log))
+
+
+class TimedViewMixin(object):
+    """
+    Records authentication and permission checks as phases of the
+    request's Server-Timing header.
+    """
+
+    def perform_authentication(self, request):
+        with timed(request, 'auth'):
+            super(TimedViewMixin, self).perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timed(request, 'perm'):
+            super(TimedViewMixin, self).check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed(request, 'perm'):
+            super(TimedViewMixin, self).check_object_permissions(request, obj)
+
+
+class ReplicaReadMixin(object):
+    """
+    Serves safe-method requests from the read replica, unless the user made
+    a write within the last FOOD_POLL_REPLICA_STICKY_SECONDS.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with read_from(False):
+            return super(ReplicaReadMixin, self).dispatch(
+                request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super(ReplicaReadMixin, self).initial(request, *args, **kwargs)
+        if replica_configured() and request.method in SAFE_METHODS:
+            user = request.user
+            use_replica(not (user.is_authenticated and is_sticky(user.pk)))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and \
+                response.status_code < 400 and replica_configured() and \
+                request.user.is_authenticated:
+            stick_to_primary(request.user.pk)
+        return super(ReplicaReadMixin, self).finalize_response(
+            request, response, *args, **kwargs)
+
+
+class ValuesListMixin(object):
+    """
+    Renders the list action from `values()` rows with `ValuesSerializer`
+    instead of serializing model instances.
+    """
+
+    def get_values_serializer(self):
+        return ValuesSerializer(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_values_serializer()
+        ordering = getattr(self.paginator, 'ordering', ())
+        queryset = serializer.values(
+            self.filter_queryset(self.get_queryset()),
+            [field.lstrip('-') for field in ordering])
+
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(serializer.to_representation(queryset))
+        return self.get_paginated_response(serializer.to_representation(page))
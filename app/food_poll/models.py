@@ -1,31 +1,158 @@
 import datetime
+import hashlib
+import secrets
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import BooleanField, Count, Exists, F, OuterRef, \
+    Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .database import lock_table
+from .menucache import bump_menu_version
+from .search import search_queryset
+
+# Rows per INSERT ... ON CONFLICT statement, well below PostgreSQL's limit
+# on query parameters
+UPSERT_BATCH_SIZE = 1000
 
 
 class Restaurant(models.Model):
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
+class MenuQuerySet(models.QuerySet):
+
+    def with_voted(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                voted=Value(False, output_field=BooleanField()))
+        return self.annotate(voted=Exists(MenuVote.objects.filter(
+            menu=OuterRef('pk'), user=user)))
+
+    def search(self, query):
+        """
+        Full-text search over descriptions, see `search_queryset()`; order
+        by `rank` to get the best matches first.
+        """
+        return search_queryset(self, query,
+                               connections[self.db].vendor)
+
+    def for_fields(self, user, fields):
+        queryset = self
+        if 'voted' in fields:
+            queryset = queryset.with_voted(user)
+        if 'menuvotes' in fields:
+            queryset = queryset.prefetch_related('menuvote_set')
+        return queryset
+
+    def add_votes(self, delta):
+        return self.update(totalvotes=F('totalvotes') + delta)
+
+    def bulk_upsert(self, rows):
+        """
+        Creates or updates menus from dicts with restaurant (id), date and
+        description keys; returns the number of created and updated menus.
+        """
+        rows = {(row['restaurant'], row['date']): row['description']
+                for row in rows}
+        if not rows:
+            return 0, 0
+
+        now = timezone.now()
+        if connections[self.db].vendor == 'postgresql':
+            return self._upsert_on_conflict(rows, now)
+
+        with transaction.atomic(using=self.db):
+            # No other upload can create one of the new menus between the
+            # lookup and the insert
+            lock_table(Menu, using=self.db)
+            existing = list(self.filter(
+                restaurant_id__in={key[0] for key in rows},
+                date__in={key[1] for key in rows}))
+            updated = []
+            for menu in existing:
+                description = rows.pop((menu.restaurant_id, menu.date), None)
+                if description is not None:
+                    menu.description = description
+                    menu.updated_at = now
+                    updated.append(menu)
+
+            self.bulk_update(updated, ['description', 'updated_at'])
+            self.bulk_create([
+                Menu(restaurant_id=restaurant_id, date=date,
+                     description=description)
+                for (restaurant_id, date), description in rows.items()
+            ])
+            bump_menu_version()
+        return len(rows), len(updated)
+
+    def _upsert_on_conflict(self, rows, now):
+        """
+        `bulk_upsert()` as INSERT ... ON CONFLICT, which only locks the rows
+        it writes. A row inserted by the statement has no xmax.
+        """
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        rows = list(rows.items())
+        created = 0
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                sql = (
+                    'INSERT INTO {menu} ({restaurant_id}, {date}, '
+                    '{description}, {totalvotes}, {updated_at}) '
+                    'VALUES {values} ON CONFLICT ({restaurant_id}, {date}) '
+                    'DO UPDATE SET '
+                    '{description} = EXCLUDED.{description}, '
+                    '{updated_at} = EXCLUDED.{updated_at} '
+                    'RETURNING xmax = 0'
+                ).format(
+                    menu=quote_name(Menu._meta.db_table),
+                    restaurant_id=quote_name('restaurant_id'),
+                    date=quote_name('date'),
+                    description=quote_name('description'),
+                    totalvotes=quote_name('totalvotes'),
+                    updated_at=quote_name('updated_at'),
+                    values=', '.join(['(%s, %s, %s, 0, %s)'] * len(batch)))
+                params = []
+                for (restaurant_id, date), description in batch:
+                    params.extend([restaurant_id, date, description, now])
+                cursor.execute(sql, params)
+                created += sum(inserted for inserted, in cursor.fetchall())
+            bump_menu_version()
+        return created, len(rows) - created
+
+    def rebuild_totalvotes(self):
+        votes = MenuVote.objects.filter(menu=OuterRef('pk')).order_by() \
+            .values('menu').annotate(count=Count('pk')).values('count')
+        return self.update(totalvotes=Coalesce(
+            Subquery(votes, output_field=models.IntegerField()), 0))
+
+
 class Menu(models.Model):
     class Meta:
         unique_together = (('restaurant', 'date'),)
+        indexes = [
+            models.Index(fields=['date', 'id'], name='food_poll_menu_date_id'),
+        ]
+
+    objects = MenuQuerySet.as_manager()
 
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
     date = models.DateField(default=datetime.date.today)
     description = models.TextField(max_length=5000)
+    totalvotes = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     @property
     def menuvotes(self):
-        return self.menuvote_set.values() or []
-
-    @property
-    def totalvotes(self):
-        return len(self.menuvote_set.values()) or 0
+        return self.menuvote_set.all()
 
     def __str__(self):
         return self.restaurant.name + " " + str(self.date)
@@ -34,6 +161,10 @@ class Menu(models.Model):
 class MenuVote(models.Model):
     class Meta:
         unique_together = (('menu', 'user'),)
+        indexes = [
+            models.Index(fields=['user', 'menu'],
+                         name='food_poll_menuvote_user_menu'),
+        ]
 
     menu = models.ForeignKey(Menu, on_delete=models.CASCADE)
     user = models.ForeignKey('auth.User', related_name='menuvotes',
@@ -47,3 +178,75 @@ class Profile(models.Model):
 
     def __str__(self):
         return self.user.username
+
+
+class DailyResultQuerySet(models.QuerySet):
+
+    def close_days(self, start, end):
+        """
+        Replaces the results of every day from `start` to `end` (inclusive)
+        with a fresh tally of the votes for that day's menus. Running it
+        again for the same days gives the same rows.
+        """
+        menus = Menu.objects.filter(date__range=(start, end)).annotate(
+            votes=Count('menuvote')).order_by('date', '-votes', 'id') \
+            .values_list('id', 'date', 'restaurant_id', 'votes')
+
+        results = []
+        previous = None
+        for menu_id, date, restaurant_id, votes in menus:
+            if previous is None or previous.date != date:
+                position, rank = 1, 1
+            else:
+                position += 1
+                if votes != previous.votes:
+                    rank = position
+            previous = DailyResult(date=date, restaurant_id=restaurant_id,
+                                   menu_id=menu_id, votes=votes, rank=rank)
+            results.append(previous)
+
+        with transaction.atomic(using=self.db):
+            self.filter(date__range=(start, end)).delete()
+            self.bulk_create(results)
+        return len(results)
+
+
+class DailyResult(models.Model):
+    class Meta:
+        unique_together = (('date', 'restaurant'),)
+        indexes = [
+            models.Index(fields=['date', 'rank'],
+                         name='food_poll_dailyresult_rank'),
+        ]
+
+    objects = DailyResultQuerySet.as_manager()
+
+    date = models.DateField()
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
+    menu = models.OneToOneField(Menu, on_delete=models.CASCADE)
+    votes = models.PositiveIntegerField()
+    rank = models.PositiveIntegerField()
+
+
+def hash_token(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class AuthTokenQuerySet(models.QuerySet):
+
+    def issue(self, user):
+        """
+        Creates a token for `user` and returns it with its key; only the
+        key's hash is stored, so the key can't be shown again later.
+        """
+        key = secrets.token_urlsafe(32)
+        return self.create(user=user, digest=hash_token(key)), key
+
+
+class AuthToken(models.Model):
+    objects = AuthTokenQuerySet.as_manager()
+
+    digest = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey('auth.User', related_name='auth_tokens',
+                             on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
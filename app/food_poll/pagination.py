@@ -0,0 +1,153 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a composite, unique ordering.
+
+    The cursor stores the full key of the boundary row, so every page is
+    fetched with a single `WHERE (key) > (cursor) ORDER BY key LIMIT n`
+    query - no OFFSET and no COUNT(*).
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        # Read on every request, so changed settings apply without a reload
+        self.page_size = getattr(settings, 'FOOD_POLL_PAGE_SIZE', 100)
+        self.max_page_size = getattr(
+            settings, 'FOOD_POLL_MAX_PAGE_SIZE', 1000)
+        return super(KeysetPagination, self).get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse, position = self.cursor or (False, None)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [_invert(field) for field in ordering]
+
+        if position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_keyset_filter(ordering, position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following_position = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_keyset_filter(self, ordering, position):
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            equal = {
+                previous.lstrip('-'): value
+                for previous, value in zip(ordering[:index], position)
+            }
+            conditions.append(Q(**equal, **{name + lookup: position[index]}))
+        return reduce(or_, conditions)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor((False, self.get_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor((True, self.get_position(self.page[0])))
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(instance, dict):
+                value = instance[name]
+            else:
+                value = getattr(instance, name)
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            reverse = bool(tokens['r'])
+            position = tokens['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, position
+
+    def encode_cursor(self, cursor):
+        reverse, position = cursor
+        tokens = json.dumps({'r': int(reverse), 'p': position},
+                            separators=(',', ':'))
+        encoded = urlsafe_b64encode(tokens.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   encoded)
+
+
+class MenuPagination(KeysetPagination):
+    ordering = ('date', 'id')
+
+
+class MenuSearchPagination(KeysetPagination):
+    ordering = ('rank', 'id')
+
+
+class MenuVotePagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class LogEntryPagination(KeysetPagination):
+    ordering = ('-requested_at', '-id')
+
+
+class DailyResultPagination(KeysetPagination):
+    ordering = ('-date', 'rank', 'id')
+
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else '-' + field
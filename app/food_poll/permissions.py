@@ -1,6 +1,6 @@
 from rest_framework import permissions
 
-from .models import Profile
+from .principal import get_principal
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -17,16 +17,13 @@ class IsEmployee(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return True
-        profile = Profile.objects.filter(user=request.user).first()
-        return profile and profile.employee
+        return get_principal(request).employee
 
     def has_object_permission(self, request, view, obj):
-        profile = Profile.objects.filter(user=request.user).first()
-
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        return profile and profile.employee
+        return get_principal(request).employee
 
 
 class IsRestaurantEmployee(permissions.BasePermission):
@@ -38,22 +35,12 @@ class IsRestaurantEmployee(permissions.BasePermission):
         if not request.user.is_authenticated or request.user.is_anonymous:
             return False
 
-        profiles = Profile.objects.filter(user=request.user).first()
-
-        if not profiles:
-            return False
-
-        restaurants = profiles.restaurants.all()
-
-        if not restaurants:
-            return False
+        restaurant_ids = get_principal(request).restaurant_ids
 
         if view.basename == 'restaurant':
-            if obj in restaurants:
-                return True
+            return obj.pk in restaurant_ids
         elif view.basename == 'menu':
-            if obj.restaurant in restaurants:
-                return True
+            return obj.restaurant_id in restaurant_ids
 
         return False
 
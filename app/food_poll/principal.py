@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Profile
+
+PRINCIPAL_CACHE_TIMEOUT = getattr(
+    settings, 'FOOD_POLL_PRINCIPAL_CACHE_TIMEOUT', 300)
+
+Principal = namedtuple('Principal',
+                       ('profile_id', 'employee', 'restaurant_ids'))
+
+ANONYMOUS_PRINCIPAL = Principal(None, False, frozenset())
+
+
+def principal_cache_key(user_id):
+    return 'food_poll:principal:%s' % user_id
+
+
+def load_principal(user):
+    if not user or not user.is_authenticated:
+        return ANONYMOUS_PRINCIPAL
+
+    key = principal_cache_key(user.pk)
+    principal = cache.get(key)
+    if principal is None:
+        rows = list(Profile.objects.filter(user=user).values_list(
+            'id', 'employee', 'restaurants'))
+        principal = ANONYMOUS_PRINCIPAL
+        if rows:
+            profile_id, employee, _ = rows[0]
+            principal = Principal(profile_id, employee, frozenset(
+                restaurant_id for _, _, restaurant_id in rows
+                if restaurant_id is not None))
+        cache.set(key, principal, PRINCIPAL_CACHE_TIMEOUT)
+    return principal
+
+
+def get_principal(request):
+    user = request.user
+    cached = getattr(request, '_food_poll_principal', None)
+    if cached is None or cached[0] != user.pk:
+        cached = (user.pk, load_principal(user))
+        request._food_poll_principal = cached
+    return cached[1]
+
+
+def invalidate_principals(user_ids):
+    keys = [principal_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    # A concurrent request may re-cache the old rows before the write commits
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,117 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+LOGS_ALIAS = 'logs'
+
+LOG_APP_LABEL = 'rest_framework_tracking'
+
+STICKY_SECONDS = getattr(settings, 'FOOD_POLL_REPLICA_STICKY_SECONDS', 10)
+
+_state = threading.local()
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.databases
+
+
+def logs_configured():
+    return LOGS_ALIAS in connections.databases
+
+
+def reads_from_replica():
+    return getattr(_state, 'replica', False) and replica_configured()
+
+
+def use_replica(replica):
+    _state.replica = replica
+
+
+@contextmanager
+def read_from(replica):
+    """
+    Routes the reads of the current thread to the replica (or, with
+    `replica` False, to the primary) for the duration of the block.
+    """
+    previous = getattr(_state, 'replica', False)
+    use_replica(replica)
+    try:
+        yield
+    finally:
+        use_replica(previous)
+
+
+def sticky_key(user_id):
+    return 'food_poll:replica:sticky:%s' % user_id
+
+
+def stick_to_primary(user_id):
+    """
+    Sends the user's reads to the primary until the replica has caught up
+    with the write they just made.
+    """
+    cache.set(sticky_key(user_id), True, STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return cache.get(sticky_key(user_id)) is not None
+
+
+class ReplicaRouter(object):
+    """
+    Reads go to the replica while `use_replica(True)` is in effect, which
+    ReplicaReadMixin does for safe-method requests. Writes always go to the
+    primary, also for instances that were read from the replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reads_from_replica():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+class LogsRouter(object):
+    """
+    Keeps rest_framework_tracking's APIRequestLog in the 'logs' database,
+    when one is configured, so request logging doesn't contend with votes
+    for the primary's write lock.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == LOG_APP_LABEL and logs_configured():
+            return LOGS_ALIAS
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Log entries point at users in the primary
+        if LOGS_ALIAS in (obj1._state.db, obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The primary keeps its (then empty) log table: deleting a user
+        # still looks for the user's log entries there
+        if db == LOGS_ALIAS:
+            return app_label == LOG_APP_LABEL or model_name == 'apirequestlog'
+        return None
@@ -0,0 +1,124 @@
+import re
+
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'food_poll_menu_search'
+
+
+def sqlite_schema(table, copied=None):
+    """
+    Statements creating an external content FTS5 index over
+    Menu.description named `table`, and the triggers that keep it in sync
+    with every insert, delete and description update, including bulk and
+    raw writes. Vote count updates don't touch it.
+
+    With `copied`, the name of a table holding a menu id, the triggers only
+    maintain rows up to that id; `rebuild_search_index` indexes the rest.
+    """
+    def when(row):
+        if copied is None:
+            return ''
+        return 'WHEN %s.id <= (SELECT id FROM %s) ' % (row, copied)
+
+    return tuple(statement.format(table=table) for statement in (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        "description, content='food_poll_menu', content_rowid='id', "
+        "tokenize='porter unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS {table}_insert "
+        "AFTER INSERT ON food_poll_menu " + when('new') + "BEGIN "
+        "INSERT INTO {table}(rowid, description) "
+        "VALUES (new.id, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS {table}_delete "
+        "AFTER DELETE ON food_poll_menu " + when('old') + "BEGIN "
+        "INSERT INTO {table}({table}, rowid, description) "
+        "VALUES ('delete', old.id, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS {table}_update "
+        "AFTER UPDATE OF description ON food_poll_menu " + when('old') +
+        "BEGIN "
+        "INSERT INTO {table}({table}, rowid, description) "
+        "VALUES ('delete', old.id, old.description); "
+        "INSERT INTO {table}(rowid, description) "
+        "VALUES (new.id, new.description); END",
+    ))
+
+
+def sqlite_drop(table):
+    return tuple(statement.format(table=table) for statement in (
+        "DROP TRIGGER IF EXISTS {table}_insert",
+        "DROP TRIGGER IF EXISTS {table}_delete",
+        "DROP TRIGGER IF EXISTS {table}_update",
+        "DROP TABLE IF EXISTS {table}",
+    ))
+
+
+# PostgreSQL searches an expression index, which needs no triggers
+POSTGRESQL_DOCUMENT = "to_tsvector('english', food_poll_menu.description)"
+
+POSTGRESQL_SCHEMA = (
+    "CREATE INDEX IF NOT EXISTS food_poll_menu_search ON food_poll_menu "
+    "USING gin ((%s))" % POSTGRESQL_DOCUMENT,
+)
+
+POSTGRESQL_DROP = ("DROP INDEX IF EXISTS food_poll_menu_search",)
+
+
+def _execute(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install(connection):
+    """
+    Creates the search index and, on SQLite, the triggers that maintain it.
+    Safe to run again, e.g. after a migration rebuilt the menu table and
+    dropped its triggers.
+    """
+    if connection.vendor == 'sqlite':
+        _execute(connection, sqlite_schema(SEARCH_TABLE))
+    elif connection.vendor == 'postgresql':
+        _execute(connection, POSTGRESQL_SCHEMA)
+
+
+def uninstall(connection):
+    if connection.vendor == 'sqlite':
+        _execute(connection, sqlite_drop(SEARCH_TABLE))
+    elif connection.vendor == 'postgresql':
+        _execute(connection, POSTGRESQL_DROP)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def search_queryset(queryset, query, vendor):
+    """
+    Menus of `queryset` whose description contains every word of `query`,
+    annotated with a `rank` that is lower for better matches.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.annotate(rank=Value(0, FloatField())).none()
+
+    if vendor == 'sqlite':
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=['%s.rowid = food_poll_menu.id' % SEARCH_TABLE,
+                   '%s MATCH %%s' % SEARCH_TABLE],
+            params=[' '.join('"%s"' % term for term in terms)],
+        ).annotate(rank=RawSQL('%s.rank' % SEARCH_TABLE, (),
+                               output_field=FloatField()))
+    if vendor == 'postgresql':
+        tsquery = "plainto_tsquery('english', %s)"
+        return queryset.extra(
+            where=['%s @@ %s' % (POSTGRESQL_DOCUMENT, tsquery)],
+            params=[' '.join(terms)],
+        ).annotate(rank=RawSQL(
+            '-ts_rank(%s, %s)' % (POSTGRESQL_DOCUMENT, tsquery),
+            (' '.join(terms),), output_field=FloatField()))
+
+    # No full-text index, e.g. other backends: unranked substring matches
+    for term in terms:
+        queryset = queryset.filter(description__icontains=term)
+    return queryset.annotate(rank=Value(0, FloatField()))
@@ -0,0 +1,115 @@
+import datetime
+import json
+import random
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.test.utils import override_settings
+from django.utils.timezone import now
+from rest_framework_tracking.models import APIRequestLog
+
+from .models import DailyResult, Menu, MenuVote, Profile, Restaurant
+
+SEED_PASSWORD = 'benchmark'
+
+
+@contextmanager
+def benchmark_database(use_current_db=False):
+    """
+    Runs the block on a throwaway test database, unless `use_current_db`,
+    with DEBUG off and requests accepted from any host.
+    """
+    old_name = None
+    if not use_current_db:
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['*']):
+            yield
+    finally:
+        if old_name is not None:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def write_results(results, path):
+    if path:
+        with open(path, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+
+DISHES = (
+    'pizza', 'pasta', 'lasagna', 'risotto', 'burger', 'fries', 'salad',
+    'soup', 'curry', 'ramen', 'sushi', 'tacos', 'burrito', 'falafel',
+    'hummus', 'kebab', 'steak', 'chicken', 'salmon', 'tofu', 'dumplings',
+    'pancakes', 'vegan', 'vegetarian', 'gluten-free', 'spicy', 'dessert',
+)
+
+
+def menu_description(rng):
+    return ', '.join(
+        '%s: %d$' % (' '.join(rng.sample(DISHES, 2)), rng.randint(3, 15))
+        for _ in range(rng.randint(2, 6)))
+
+
+def seed_database(restaurants=200, days=5 * 365, employees=5000,
+                  log_entries=100000, seed=0, log=None):
+    """
+    Fills the current database with `restaurants` restaurants publishing a
+    menu every day for the last `days` days, `employees` employees voting
+    for one menu each day and `log_entries` API log entries.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    password = make_password(SEED_PASSWORD)
+    today = datetime.date.today()
+
+    with transaction.atomic():
+        Restaurant.objects.bulk_create(
+            [Restaurant(name='Restaurant %d' % index)
+             for index in range(restaurants)])
+        restaurant_ids = list(Restaurant.objects.filter(
+            name__startswith='Restaurant ').values_list('id', flat=True))
+
+        User.objects.bulk_create(
+            [User(username='employee_%d' % index, password=password)
+             for index in range(employees)])
+        user_ids = list(User.objects.filter(
+            username__startswith='employee_').values_list('id', flat=True))
+        Profile.objects.bulk_create(
+            [Profile(user_id=user_id, employee=True) for user_id in user_ids])
+        log("Created %d restaurants and %d employees" % (
+            len(restaurant_ids), len(user_ids)))
+
+        for offset in range(days):
+            date = today - datetime.timedelta(days=offset)
+            Menu.objects.bulk_create(
+                [Menu(restaurant_id=restaurant_id, date=date,
+                      description=menu_description(rng))
+                 for restaurant_id in restaurant_ids])
+            menu_ids = list(Menu.objects.filter(
+                date=date).values_list('id', flat=True))
+            if menu_ids:
+                MenuVote.objects.bulk_create(
+                    [MenuVote(menu_id=rng.choice(menu_ids), user_id=user_id)
+                     for user_id in user_ids])
+            if offset and offset % 100 == 0:
+                log("Created menus and votes for %d days" % offset)
+        Menu.objects.rebuild_totalvotes()
+        if days > 1:
+            DailyResult.objects.close_days(
+                today - datetime.timedelta(days=days - 1),
+                today - datetime.timedelta(days=1))
+
+        requested_at = now()
+        APIRequestLog.objects.bulk_create([
+            APIRequestLog(
+                requested_at=requested_at - datetime.timedelta(seconds=index),
+                path='/menus/%d/vote/' % index, remote_addr='127.0.0.1',
+                host='localhost', method='POST', status_code=200,
+                user_id=rng.choice(user_ids) if user_ids else None)
+            for index in range(log_entries)
+        ])
+        log("Created %d log entries" % log_entries)
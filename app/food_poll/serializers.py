@@ -1,58 +1,94 @@
+from collections import OrderedDict
+
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework_tracking.models import APIRequestLog
 
-from .models import Restaurant, Menu, MenuVote, Profile
+from .fields import HyperlinkedIdentityField, HyperlinkedRelatedField, \
+    get_url_template
+from .models import Restaurant, Menu, MenuVote, Profile, DailyResult
+from .principal import get_principal
+from .timing import timed
+
+
+class TimedSerializerMixin(object):
+    def to_representation(self, instance):
+        with timed(self.context.get('request'), 'serialize'):
+            return super(TimedSerializerMixin, self).to_representation(
+                instance)
+
 
+class HyperlinkedModelSerializer(TimedSerializerMixin,
+                                 serializers.HyperlinkedModelSerializer):
+    serializer_url_field = HyperlinkedIdentityField
+    serializer_related_field = HyperlinkedRelatedField
 
-class RestaurantSerializer(serializers.HyperlinkedModelSerializer):
+
+class RestaurantSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = Restaurant
         fields = ('id', 'name', 'url')
 
     def create(self, validated_data):
+        user = self.context['request'].user
         restaurant = Restaurant.objects.create(name=validated_data.get('name'))
-        profile = Profile.objects.filter(
-            user=self.context['request'].user).first()
-        if not profile:
-            profile = Profile.objects.create(user=self.context['request'].user)
+        profile_id = get_principal(self.context['request']).profile_id
+        if profile_id:
+            profile = Profile(pk=profile_id, user=user)
+        else:
+            profile = Profile.objects.create(user=user)
         profile.restaurants.add(restaurant)
         return restaurant
 
 
-class MenuVoteSerializer(serializers.HyperlinkedModelSerializer):
+class MenuVoteSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = MenuVote
         fields = ('id', 'url', 'menu', 'user')
 
 
-class MenuSerializer(serializers.HyperlinkedModelSerializer):
+class VoteIntentSerializer(serializers.Serializer):
+    menu = serializers.IntegerField()
+    voted = serializers.BooleanField()
+
+
+class MenuRowSerializer(serializers.Serializer):
+    restaurant = serializers.IntegerField()
+    date = serializers.DateField()
+    description = serializers.CharField(max_length=5000)
+
+
+class MenuSerializer(HyperlinkedModelSerializer):
     menuvotes = serializers.SerializerMethodField()
     voted = serializers.SerializerMethodField()
 
+    # Renders method fields from annotated columns in ValuesSerializer
+    values_fields = {'voted': bool}
+
     class Meta:
         model = Menu
         fields = ('id', 'url', 'date', 'restaurant', 'description',
                   'menuvotes', 'totalvotes', 'voted')
 
     def get_menuvotes(self, obj):
-        return [MenuVoteSerializer(
-            menuvote, context={'request': self.context['request']}
-        ).data for menuvote in obj.menuvote_set.all()]
+        return MenuVoteSerializer(
+            obj.menuvote_set.all(), many=True,
+            context={'request': self.context['request']}
+        ).data
 
     def get_voted(self, obj):
-        return bool(obj.menuvote_set.filter(
+        if hasattr(obj, 'voted'):
+            return bool(obj.voted)
+        return obj.menuvote_set.filter(
             user=self.context['request'].user
-        ).first())
+        ).exists()
 
     def create(self, validated_data):
-        profile = Profile.objects.filter(
-            user=self.context['request'].user
-        ).first()
-        if profile or self.context['request'].user.is_superuser:
-            if self.context['request'].user.is_superuser or \
-                    validated_data.get('restaurant') in \
-                    profile.restaurants.all():
+        user = self.context['request'].user
+        principal = get_principal(self.context['request'])
+        if principal.profile_id or user.is_superuser:
+            if user.is_superuser or validated_data.get('restaurant').pk in \
+                    principal.restaurant_ids:
                 menu = super(MenuSerializer, self).create(validated_data)
                 menu.save()
                 return menu
@@ -71,8 +107,8 @@ class MenuSerializer(serializers.HyperlinkedModelSerializer):
         return super(MenuSerializer, self).get_field_names(*args, **kwargs)
 
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
-    profile = serializers.HyperlinkedRelatedField(
+class UserSerializer(HyperlinkedModelSerializer):
+    profile = HyperlinkedRelatedField(
         view_name='profile-detail', read_only=True)
 
     class Meta:
@@ -102,7 +138,7 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         return instance
 
 
-class ProfileSerializer(serializers.HyperlinkedModelSerializer):
+class ProfileSerializer(HyperlinkedModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
@@ -117,7 +153,7 @@ class ProfileSerializer(serializers.HyperlinkedModelSerializer):
         return profile
 
 
-class LogEntrySerializer(serializers.HyperlinkedModelSerializer):
+class LogEntrySerializer(HyperlinkedModelSerializer):
 
     class Meta:
         model = APIRequestLog
@@ -127,3 +163,87 @@ class LogEntrySerializer(serializers.HyperlinkedModelSerializer):
             'response', 'status_code', 'view', 'view_method', 'errors',
             'user_id'
         )
+
+
+class DailyResultSerializer(HyperlinkedModelSerializer):
+    restaurant_name = serializers.CharField(source='restaurant.name')
+
+    class Meta:
+        model = DailyResult
+        fields = ('id', 'url', 'date', 'restaurant', 'restaurant_name', 'menu',
+                  'votes', 'rank')
+
+
+def _identity(value):
+    return value
+
+
+class ValuesSerializer(object):
+    """
+    Read-only rendering of a model serializer's fields from `values()` rows,
+    skipping model instances and the per-row field machinery. Hyperlinks
+    are reversed once and only the pk is filled in per row. Method fields
+    are read from annotations listed in the serializer's `values_fields`;
+    a field that can't be rendered this way raises TypeError.
+    """
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.fields = [
+            (name,) + self.build_field(name, field)
+            for name, field in serializer.fields.items()
+            if not field.write_only
+        ]
+
+    def build_field(self, name, field):
+        model = self.serializer.Meta.model
+        if isinstance(field, serializers.HyperlinkedIdentityField):
+            return model._meta.pk.attname, self.build_url(field)
+        if isinstance(field, serializers.ManyRelatedField):
+            raise TypeError("Can't render many-to-many field %r" % name)
+        if isinstance(field, serializers.SerializerMethodField):
+            values_fields = getattr(self.serializer, 'values_fields', {})
+            if name not in values_fields:
+                raise TypeError("Can't render method field %r" % name)
+            return name, values_fields[name]
+
+        column = field.source.replace('.', '__')
+        if isinstance(field, serializers.RelatedField):
+            column = getattr(model._meta.get_field(column), 'attname', None)
+            if column is None:
+                raise TypeError("Can't render reverse relation %r" % name)
+            if isinstance(field, serializers.HyperlinkedRelatedField):
+                return column, self.build_url(field)
+            return column, _identity
+        return column, field.to_representation
+
+    def build_url(self, field):
+        if field.lookup_field != 'pk':
+            raise TypeError("Can't render hyperlinks looked up by %r" %
+                            field.lookup_field)
+        format = self.serializer.context.get('format')
+        if format and field.format and field.format != format:
+            format = field.format
+        prefix, suffix = get_url_template(
+            field, field.view_name, self.serializer.context['request'],
+            format)
+        return lambda pk: '%s%s%s' % (prefix, pk, suffix)
+
+    @property
+    def columns(self):
+        return [column for _, column, _ in self.fields]
+
+    def values(self, queryset, extra_columns=()):
+        columns = self.columns
+        return queryset.values(*columns + [
+            column for column in extra_columns if column not in columns])
+
+    def to_representation(self, rows):
+        with timed(self.serializer.context.get('request'), 'serialize'):
+            fields = self.fields
+            return [
+                OrderedDict(
+                    (name, None if row[column] is None else convert(
+                        row[column]))
+                    for name, column, convert in fields)
+                for row in rows
+            ]
@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
+from django.dispatch import receiver
+from rest_framework_tracking.models import APIRequestLog
+
+from .authentication import token_cache
+from .backends import invalidate_users
+from .menucache import bump_menu_version, bump_restaurants_version
+from .models import AuthToken, Menu, Profile, Restaurant
+from .principal import invalidate_principals
+from .routers import logs_configured
+
+
+@receiver(pre_delete, sender=User)
+def remove_user_votes_from_totals(sender, instance, **kwargs):
+    Menu.objects.filter(menuvote__user=instance).add_votes(-1)
+
+
+@receiver(pre_delete, sender=User)
+def detach_user_log_entries(sender, instance, **kwargs):
+    # Deleting the user only nulls log entries in the user's own database
+    if logs_configured():
+        APIRequestLog.objects.filter(user_id=instance.pk).update(user=None)
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+def invalidate_menu_payloads(sender, **kwargs):
+    bump_menu_version()
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurants_etag(sender, **kwargs):
+    bump_restaurants_version()
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_principal(sender, instance, **kwargs):
+    invalidate_principals([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Profile.restaurants.through)
+def invalidate_restaurant_principals(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_principals([instance.user_id])
+    elif action == 'pre_clear':
+        invalidate_principals(
+            instance.profile_set.values_list('user_id', flat=True))
+    elif action.startswith('post_') and pk_set:
+        invalidate_principals(Profile.objects.filter(
+            pk__in=pk_set).values_list('user_id', flat=True))
+
+
+@receiver(pre_delete, sender=Restaurant)
+def invalidate_deleted_restaurant_principals(sender, instance, **kwargs):
+    invalidate_principals(
+        instance.profile_set.values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=AuthToken)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.discard(instance.digest)
+    transaction.on_commit(lambda: token_cache.discard(instance.digest))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+    token_cache.discard_user(instance.pk)
+    transaction.on_commit(lambda: token_cache.discard_user(instance.pk))
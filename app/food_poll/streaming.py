@@ -0,0 +1,111 @@
+import json
+import threading
+
+from django.conf import settings
+from rest_framework import renderers
+
+from .database import close_thread_connections
+
+KEEPALIVE_INTERVAL = getattr(settings, 'FOOD_POLL_STREAM_KEEPALIVE', 15)
+
+
+def format_event(event, data):
+    return 'event: %s\ndata: %s\n\n' % (
+        event, json.dumps(data, separators=(',', ':')))
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Lets `text/event-stream` requests through content negotiation; errors
+    raised before the stream starts are sent as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data)
+
+
+class Subscription(object):
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.pending = {}
+
+    def get(self, timeout=None):
+        """
+        Waits up to `timeout` seconds for new tallies and returns every
+        tally published since the last call, at most one per menu.
+        """
+        with self.publisher.condition:
+            if not self.pending:
+                self.publisher.condition.wait(timeout)
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def close(self):
+        self.publisher.unsubscribe(self)
+
+
+class TallyPublisher(object):
+    """
+    Fans vote tallies out to every subscriber of this process. Tallies for
+    the same menu that a subscriber hasn't picked up yet are merged, so a
+    slow client never holds more than one entry per menu.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.subscribers = set()
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self.condition:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.condition:
+            self.subscribers.discard(subscription)
+
+    def publish(self, tallies):
+        if not tallies:
+            return
+        with self.condition:
+            for subscription in self.subscribers:
+                subscription.pending.update(tallies)
+            self.condition.notify_all()
+
+
+tally_publisher = TallyPublisher()
+
+
+def tally_stream(publisher, snapshot):
+    """
+    Yields the (menu id, totalvotes) pairs returned by `snapshot()` as one
+    event, then every tally published afterwards. The subscription is made
+    before the snapshot is read, so no vote in between is missed.
+
+    Tallies come from the votes of this process only. The stream doesn't
+    touch the database after the snapshot, so the connection the snapshot
+    used is closed rather than held for the lifetime of the stream.
+    """
+    subscription = publisher.subscribe()
+    try:
+        try:
+            tallies = [{'menu': menu_id, 'totalvotes': totalvotes}
+                       for menu_id, totalvotes in snapshot()]
+        finally:
+            close_thread_connections()
+        yield format_event('snapshot', tallies)
+        while True:
+            tallies = subscription.get(KEEPALIVE_INTERVAL)
+            if not tallies:
+                yield ': keepalive\n\n'
+            for menu_id, totalvotes in sorted(tallies.items()):
+                yield format_event(
+                    'tally', {'menu': menu_id, 'totalvotes': totalvotes})
+    finally:
+        subscription.close()
+        close_thread_connections()
@@ -1,13 +1,44 @@
+import asyncio
 import base64
 import datetime
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
 import uuid
-
-from rest_framework import status
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import IntegrityError, connection, connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import set_script_prefix
+from django.utils.timezone import now
+from rest_framework import serializers, status
+from rest_framework.reverse import reverse as drf_reverse
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth import get_user_model
 from rest_framework.utils.serializer_helpers import ReturnList
 
-from .models import Restaurant, Menu, MenuVote, Profile
+from . import database, fields, logwriter, routers, streaming
+from .asgi import ASGIHandler
+from .authentication import token_cache
+from .menucache import get_menu_version
+from .models import Restaurant, Menu, MenuQuerySet, MenuVote, Profile, \
+    DailyResult, AuthToken
+from .principal import load_principal
+from .serializers import LogEntrySerializer, MenuSerializer, \
+    MenuVoteSerializer, ValuesSerializer
+from .views import UserViewSet, menuview_fields
+from .voting import toggle_vote
 from rest_framework_tracking.models import APIRequestLog
 
 User = get_user_model()
@@ -25,10 +56,54 @@ USER_PASSWORD = 'test_user'
 ADMIN_USERNAME = 'admin'
 ADMIN_PASSWORD = '94a610c6-db55-4fab-acaa-d34e1c21412d'
 ADMIN_EMAIL = 'admin@test.com'
+EMPLOYEE_AUTH_HEADERS = {
+    'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(
+        b'employee:employee').decode("ascii")
+}
+
+
+class FileDatabaseMixin(object):
+    """
+    Runs a test case on a file copy of the in-memory SQLite test database.
+    Tests that use the database from several threads need one: the shared
+    in-memory database locks whole tables and can't use WAL.
+    """
+    _memory_database = None
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            cls._database_dir = tempfile.TemporaryDirectory()
+            name = os.path.join(cls._database_dir.name, 'test_db.sqlite3')
+            connection.ensure_connection()
+            target = sqlite3.connect(name)
+            connection.connection.backup(target)
+            target.close()
+            # Closing the last connection would drop the in-memory database
+            cls._memory_database = (connection.settings_dict['NAME'],
+                                    connection.connection)
+            connection.connection = None
+            connection.settings_dict['NAME'] = name
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls._memory_database:
+            connection.close()
+            connection.settings_dict['NAME'], connection.connection = \
+                cls._memory_database
+            cls._memory_database = None
+            cls._database_dir.cleanup()
+            # Cached users and principals of the copy may share their ids
+            # with rows of the in-memory database
+            cache.clear()
+            token_cache.clear()
 
 
 class BaseAPITestCase(APITestCase):
     def setUp(self):
+        cache.clear()
         self.admin = User.objects.create_superuser(
             username=ADMIN_USERNAME,
             email=ADMIN_EMAIL,
@@ -163,6 +238,56 @@ class RestaurantAPITestCase(BaseAPITestCase):
         self.assertTrue(resp_user.data)
 
 
+class PrincipalTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user_object = User.objects.get(id=self.user.get('id'))
+        self.profile = Profile.objects.get(user=self.user_object)
+        self.restaurant = Restaurant.objects.create(name='test_restaurant')
+
+    def test_principal_is_cached_across_requests(self):
+        with self.assertNumQueries(1):
+            principal = load_principal(self.user_object)
+        self.assertEqual(principal.profile_id, self.profile.id)
+        self.assertFalse(principal.employee)
+        self.assertEqual(principal.restaurant_ids, frozenset())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(load_principal(self.user_object), principal)
+
+    def test_principal_is_invalidated_on_profile_changes(self):
+        load_principal(self.user_object)
+
+        self.profile.restaurants.add(self.restaurant)
+        self.assertEqual(load_principal(self.user_object).restaurant_ids,
+                         frozenset([self.restaurant.id]))
+
+        self.profile.employee = True
+        self.profile.save()
+        self.assertTrue(load_principal(self.user_object).employee)
+
+        self.restaurant.profile_set.clear()
+        self.assertEqual(load_principal(self.user_object).restaurant_ids,
+                         frozenset())
+
+        self.restaurant.profile_set.add(self.profile)
+        self.restaurant.delete()
+        self.assertEqual(load_principal(self.user_object).restaurant_ids,
+                         frozenset())
+
+    def test_restaurant_permission_follows_profile_changes(self):
+        url = RESTAURANTS_URL + str(self.restaurant.id) + '/'
+
+        response = self.user_client.patch(url, {'name': 'edited'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.profile.restaurants.add(self.restaurant)
+
+        response = self.user_client.patch(url, {'name': 'edited'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
 class MenuAPITestCase(RestaurantAPITestCase):
 
     def setUp(self):
@@ -324,6 +449,177 @@ class MenuAPITestCase(RestaurantAPITestCase):
         self.assertEqual(resp_employee.status_code, status.HTTP_200_OK)
         self.assertEqual(resp_employee.data.get('voted'), False)
 
+    def test_menu_vote_updates_totalvotes(self):
+        MENU_VOTE_URL = MENUS_URL + str(self.menu.id) + '/vote/'
+        self.menu.refresh_from_db()
+        initial_votes = self.menu.totalvotes
+
+        client.post(MENU_VOTE_URL, **EMPLOYEE_AUTH_HEADERS)
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.totalvotes, initial_votes + 1)
+
+        response = self.user_client.get(MENUS_URL + 'results/')
+        totals = {menu['id']: menu['totalvotes'] for menu in response.data}
+        self.assertEqual(totals[self.menu.id], initial_votes + 1)
+        self.assertEqual(totals[self.menu_2.id], 0)
+
+        client.post(MENU_VOTE_URL, **EMPLOYEE_AUTH_HEADERS)
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.totalvotes, initial_votes)
+
+    def test_menu_vote_toggle_statements(self):
+        employee = User.objects.get(username='employee')
+        self.menu.refresh_from_db()
+        initial_votes = self.menu.totalvotes
+
+        with CaptureQueriesContext(connection) as queries:
+            result = toggle_vote(self.menu.id, employee)
+        self.assertEqual(tuple(result),
+                         (True, initial_votes + 1, str(self.menu)))
+        self.assertLessEqual(len(data_queries(queries)), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = toggle_vote(self.menu.id, employee)
+        self.assertEqual(tuple(result), (False, initial_votes, str(self.menu)))
+        self.assertLessEqual(len(data_queries(queries)), 2)
+
+    def test_menu_vote_conflict_after_retry(self):
+        with mock.patch('food_poll.voting._toggle_vote',
+                        side_effect=IntegrityError) as toggle:
+            response = client.post(
+                MENUS_URL + str(self.menu.id) + '/vote/',
+                **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(toggle.call_count, 2)
+
+    def test_menu_vote_for_missing_menu(self):
+        response = client.post(MENUS_URL + '0/vote/', **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_menu_votes_batch(self):
+        BATCH_URL = MENUS_URL + 'votes/batch/'
+        employee = User.objects.get(username='employee')
+        data = [{'menu': self.menu.id, 'voted': True},
+                {'menu': self.menu_2.id, 'voted': True}]
+
+        response = self.user_client.post(BATCH_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        log_count = APIRequestLog.objects.count()
+        response = client.post(BATCH_URL, data, format='json',
+                               **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(APIRequestLog.objects.count(), log_count + 1)
+        self.assertEqual([(item['menu'], item['voted'])
+                          for item in response.data],
+                         [(self.menu.id, True), (self.menu_2.id, True)])
+        self.assertEqual(
+            response.data[0]['totalvotes'],
+            MenuVote.objects.filter(menu=self.menu).count())
+        self.assertEqual(response.data[1]['totalvotes'], 1)
+
+        data = [{'menu': self.menu.id, 'voted': True},
+                {'menu': self.menu_2.id, 'voted': False}]
+        response = client.post(BATCH_URL, data, format='json',
+                               **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[1]['totalvotes'], 0)
+        self.assertEqual(
+            list(MenuVote.objects.filter(user=employee).values_list(
+                'menu_id', flat=True)), [self.menu.id])
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.totalvotes,
+                         MenuVote.objects.filter(menu=self.menu).count())
+
+    def test_menu_votes_batch_errors(self):
+        BATCH_URL = MENUS_URL + 'votes/batch/'
+
+        response = client.post(BATCH_URL, [
+            {'menu': self.menu.id, 'voted': True},
+            {'voted': True}
+        ], format='json', **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('menu', response.data[1])
+
+        response = client.post(BATCH_URL, [
+            {'menu': self.menu.id, 'voted': True},
+            {'menu': 0, 'voted': True}
+        ], format='json', **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('menu', response.data[1])
+
+        self.assertFalse(MenuVote.objects.filter(
+            user__username='employee').exists())
+
+    def test_menus_bulk_upload(self):
+        BULK_URL = MENUS_URL + 'bulk/'
+        today = datetime.date.today()
+        data = [
+            {'restaurant': self.restaurant_id, 'description': "Monday",
+             'date': today + datetime.timedelta(days=1)},
+            {'restaurant': self.restaurant_id, 'description': "Tuesday",
+             'date': today + datetime.timedelta(days=2)},
+            {'restaurant': self.restaurant_2_id, 'description': "Monday",
+             'date': today + datetime.timedelta(days=1)},
+            {'restaurant': self.restaurant_id, 'date': 'not a date',
+             'description': "Wednesday"},
+        ]
+
+        response = self.user_client.post(MENUS_URL + 'bulk/?atomic=true',
+                                          data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data['errors']), {2, 3})
+        self.assertEqual(Menu.objects.count(), 2)
+
+        response = self.user_client.post(BULK_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(set(response.data['errors']), {2, 3})
+        self.assertEqual(Menu.objects.count(), 4)
+
+        response = self.user_client.post(BULK_URL, [
+            {'restaurant': self.restaurant_id, 'date': today,
+             'description': "Updated"},
+            {'restaurant': self.restaurant_id, 'description': "Thursday",
+             'date': today + datetime.timedelta(days=3)},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['updated']),
+                         (1, 1))
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.description, "Updated")
+
+        response = self.admin_client.post(BULK_URL, data[2:3], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Menu.objects.count(), 6)
+
+    def test_deleting_user_removes_votes_from_totalvotes(self):
+        employee = User.objects.get(username='employee')
+        self.menu.refresh_from_db()
+        initial_votes = self.menu.totalvotes
+        MenuVote.objects.create(user=employee, menu=self.menu)
+        Menu.objects.filter(pk=self.menu.pk).add_votes(1)
+
+        employee.delete()
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.totalvotes, initial_votes)
+
+    def test_rebuild_vote_counts(self):
+        employee = User.objects.get(username='employee')
+        MenuVote.objects.create(user=employee, menu=self.menu)
+        MenuVote.objects.create(user=self.admin, menu=self.menu)
+        Menu.objects.filter(pk=self.menu_2.pk).add_votes(3)
+
+        call_command('rebuild_vote_counts', stdout=io.StringIO())
+
+        self.menu.refresh_from_db()
+        self.menu_2.refresh_from_db()
+        self.assertEqual(self.menu.totalvotes,
+                         MenuVote.objects.filter(menu=self.menu).count())
+        self.assertEqual(self.menu_2.totalvotes, 0)
+
     def test_get_todays_menus(self):
         TODAYS_MENUS_URL = MENUS_URL + 'today/'
 
@@ -354,6 +650,1328 @@ class MenuAPITestCase(RestaurantAPITestCase):
         self.assertGreater(len(responses['admin'].data), 0)
 
 
+class MenuQueryCountTestCase(BaseAPITestCase):
+    URLS = [MENUS_URL, MENUS_URL + 'today/', MENUS_URL + 'results/']
+
+    def setUp(self):
+        super().setUp()
+        self.employee_user = User.objects.get(username='employee')
+
+    def add_menus(self, count):
+        for _ in range(count):
+            restaurant = Restaurant.objects.create(name=uuid.uuid4().hex)
+            menu = Menu.objects.create(restaurant=restaurant,
+                                       description="Menu description")
+            MenuVote.objects.create(user=self.employee_user, menu=menu)
+            MenuVote.objects.create(user=self.admin, menu=menu)
+        run_commit_hooks()
+
+    def count_queries(self, api_client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_menu_endpoints_query_count_does_not_grow(self):
+        self.add_menus(2)
+        restaurant_id = Restaurant.objects.first().id
+        urls = self.URLS + [
+            RESTAURANTS_URL + str(restaurant_id) + '/today/']
+
+        expected = {
+            (api_client, url): self.count_queries(api_client, url)
+            for api_client in (self.user_client, self.admin_client)
+            for url in urls
+        }
+
+        self.add_menus(10)
+
+        for (api_client, url), query_count in expected.items():
+            self.assertEqual(self.count_queries(api_client, url),
+                             query_count, url)
+
+
+@override_settings(FOOD_POLL_SERVER_TIMING=True)
+class ServerTimingTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for index in range(3):
+            restaurant = Restaurant.objects.create(name='r%d' % index)
+            Menu.objects.create(restaurant=restaurant, description="Menu")
+
+    def get_metrics(self, response):
+        return {
+            metric.split(';')[0]: metric
+            for metric in response['Server-Timing'].split(', ')
+        }
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.user_client.get(MENUS_URL + 'today/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        metrics = self.get_metrics(response)
+        self.assertEqual(
+            set(metrics), {'db', 'auth', 'perm', 'serialize', 'total'})
+        self.assertIn('desc="%d queries"' % len(data_queries(queries)),
+                      metrics['db'])
+        self.assertNotIn('X-Duplicate-Queries', response)
+
+    def test_logging_phase(self):
+        response = self.user_client.post(RESTAURANTS_URL, {'name': 'new'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('log', self.get_metrics(response))
+
+    @override_settings(FOOD_POLL_SERVER_TIMING=False)
+    def test_disabled(self):
+        response = self.user_client.get(MENUS_URL + 'today/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(FOOD_POLL_SERVER_TIMING_DUPLICATES=True)
+    def test_duplicate_queries_header(self):
+        response = self.admin_client.get(USERS_URL)
+        self.assertNotIn('X-Duplicate-Queries', response)
+
+        with mock.patch.object(UserViewSet, 'queryset', User.objects.all()):
+            response = self.admin_client.get(USERS_URL)
+
+        duplicates = response['X-Duplicate-Queries']
+        self.assertTrue(duplicates.startswith('3x SELECT'), duplicates)
+        self.assertIn('food_poll_profile', duplicates)
+
+
+class MenuCacheTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menus = [
+            Menu.objects.create(
+                restaurant=Restaurant.objects.create(name='r%d' % index),
+                description="Menu")
+            for index in range(2)
+        ]
+
+    def test_payload_is_shared_between_users(self):
+        response = self.user_client.get(MENUS_URL + 'today/')
+        self.assertEqual(len(response.data), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            employee_response = self.client.get(
+                MENUS_URL + 'today/', **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(employee_response.data, response.data)
+        self.assertFalse([
+            query for query in queries
+            if '"food_poll_menu"."description"' in query['sql']
+        ])
+
+    def test_voted_is_merged_per_user(self):
+        self.user_client.get(MENUS_URL + 'results/')
+        self.admin_client.get(MENUS_URL + 'results/')
+        response = self.client.post(
+            MENUS_URL + str(self.menus[0].pk) + '/vote/',
+            **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(MENUS_URL + 'results/',
+                                   **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual([(menu['voted'], menu['totalvotes'])
+                          for menu in response.data], [(True, 1), (False, 0)])
+        self.assertNotIn('menuvotes', response.data[0])
+
+        response = self.user_client.get(MENUS_URL + 'results/')
+        self.assertEqual([(menu['voted'], menu['totalvotes'])
+                          for menu in response.data],
+                         [(False, 1), (False, 0)])
+
+        response = self.admin_client.get(MENUS_URL + 'results/')
+        self.assertEqual(len(response.data[0]['menuvotes']), 1)
+
+    def test_menu_changes_invalidate_payload(self):
+        self.user_client.get(MENUS_URL + 'today/')
+
+        Menu.objects.create(
+            restaurant=Restaurant.objects.create(name='new'),
+            description="New menu")
+        self.menus[0].description = "Changed"
+        self.menus[0].save()
+        version = get_menu_version()
+        run_commit_hooks()
+        self.assertEqual(get_menu_version(), version + 1)
+
+        response = self.user_client.get(MENUS_URL + 'today/')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['description'], "Changed")
+
+    def test_votes_keep_payload(self):
+        run_commit_hooks()
+        self.user_client.get(MENUS_URL + 'results/')
+        version = get_menu_version()
+        response = self.client.post(
+            MENUS_URL + str(self.menus[1].pk) + '/vote/',
+            **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        run_commit_hooks()
+        self.assertEqual(get_menu_version(), version)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.user_client.get(MENUS_URL + 'results/')
+        self.assertEqual([menu['totalvotes'] for menu in response.data],
+                         [0, 1])
+        self.assertFalse([
+            query for query in queries
+            if '"food_poll_menu"."description"' in query['sql']
+        ])
+
+
+class ConditionalGetTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.restaurant = Restaurant.objects.create(name='restaurant')
+        self.menu = Menu.objects.create(restaurant=self.restaurant,
+                                        description="Menu")
+        self.urls = [
+            MENUS_URL + 'today/',
+            RESTAURANTS_URL,
+            RESTAURANTS_URL + str(self.restaurant.pk) + '/today/',
+        ]
+
+    def get(self, url, etag=None, **headers):
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(url, **dict(EMPLOYEE_AUTH_HEADERS, **headers))
+
+    def test_not_modified(self):
+        # Only the stamp query runs; the restaurants stamp is a cached
+        # version, which needs no query at all
+        stamp_queries = {RESTAURANTS_URL: 0}
+        for url in self.urls:
+            response = self.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(url, etag)
+            self.assertEqual(response.status_code,
+                             status.HTTP_304_NOT_MODIFIED, url)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(len([
+                query for query in queries
+                if 'food_poll_' in query['sql']]),
+                stamp_queries.get(url, 1), url)
+
+    def test_etag_changes_with_menu_and_vote(self):
+        url = MENUS_URL + 'today/'
+        etag = self.get(url)['ETag']
+        user_etag = self.user_client.get(url)['ETag']
+        self.assertNotEqual(etag, user_etag)
+
+        response = self.client.post(
+            MENUS_URL + str(self.menu.pk) + '/vote/', **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data[0]['voted'])
+        response = self.user_client.get(url, HTTP_IF_NONE_MATCH=user_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = response['ETag']
+        Menu.objects.filter(pk=self.menu.pk).bulk_upsert([{
+            'restaurant': self.restaurant.pk, 'date': self.menu.date,
+            'description': "Changed"}])
+        run_commit_hooks()
+        response = self.user_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['description'], "Changed")
+
+    def test_restaurants_etag_changes(self):
+        etag = self.get(RESTAURANTS_URL)['ETag']
+        self.restaurant.name = 'renamed'
+        self.restaurant.save()
+        run_commit_hooks()
+        response = self.get(RESTAURANTS_URL, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        Restaurant.objects.create(name='new')
+        run_commit_hooks()
+        response = self.get(RESTAURANTS_URL, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        Restaurant.objects.filter(name='new').delete()
+        self.restaurant.delete()
+        run_commit_hooks()
+        response = self.get(RESTAURANTS_URL, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
+class TallyPublisherTestCase(TestCase):
+
+    def test_publish_merges_pending_tallies(self):
+        publisher = streaming.TallyPublisher()
+        first = publisher.subscribe()
+        second = publisher.subscribe()
+
+        publisher.publish({1: 1})
+        publisher.publish({1: 2, 2: 1})
+        self.assertEqual(first.get(0), {1: 2, 2: 1})
+        self.assertEqual(first.get(0), {})
+
+        second.close()
+        publisher.publish({3: 1})
+        self.assertEqual(first.get(0), {3: 1})
+        self.assertEqual(publisher.subscribers, {first})
+
+    def test_get_wakes_up_on_publish(self):
+        publisher = streaming.TallyPublisher()
+        subscription = publisher.subscribe()
+        threading.Timer(0.05, publisher.publish, [{1: 1}]).start()
+        self.assertEqual(subscription.get(5), {1: 1})
+
+
+class ResultsStreamTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menu = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name='restaurant'),
+            description="Menu")
+
+    def test_stream_sends_snapshot_then_tallies(self):
+        response = self.user_client.get(MENUS_URL + 'results/stream/',
+                                        HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        self.assertEqual(
+            next(events),
+            b'event: snapshot\ndata: [{"menu":%d,"totalvotes":0}]\n\n' %
+            self.menu.pk)
+
+        self.client.post(MENUS_URL + str(self.menu.pk) + '/vote/',
+                         **EMPLOYEE_AUTH_HEADERS)
+        self.assertEqual(
+            next(events),
+            b'event: tally\ndata: {"menu":%d,"totalvotes":1}\n\n' %
+            self.menu.pk)
+
+        response.close()
+        self.assertFalse(streaming.tally_publisher.subscribers)
+
+    def test_stream_requires_authentication(self):
+        response = self.anonymous_client.get(MENUS_URL + 'results/stream/',
+                                             HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(response.content.startswith(b'event: error\n'))
+
+
+class ResultsStreamConnectionTestCase(FileDatabaseMixin,
+                                       TransactionTestCase):
+
+    def test_stream_closes_connection_after_snapshot(self):
+        connected = []
+
+        def stream():
+            events = streaming.tally_stream(
+                streaming.TallyPublisher(),
+                lambda: Menu.objects.values_list('id', 'totalvotes'))
+            try:
+                next(events)
+                connected.append(connection.connection is not None)
+            finally:
+                events.close()
+
+        thread = threading.Thread(target=stream)
+        thread.start()
+        thread.join()
+        self.assertEqual(connected, [False])
+
+
+class ASGIHandlerTestCase(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('employee', password='employee')
+        Profile.objects.create(user=user, employee=True)
+        self.menu = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name='restaurant'),
+            description="Menu")
+        _, self.key = AuthToken.objects.issue(user)
+        self.handler = ASGIHandler(get_wsgi_application(), threads=2,
+                                   stream_threads=2)
+
+    def tearDown(self):
+        self.handler.executor.shutdown()
+        self.handler.stream_executor.shutdown()
+
+    def request(self, method, path, body=b'', headers=(), chunks=None,
+                key=None):
+        """
+        Returns the response start message and body. With `chunks` the
+        client disconnects after receiving that many body chunks.
+        """
+        messages = []
+
+        async def run():
+            received = asyncio.Event()
+
+            async def receive():
+                if not messages and not received.is_set():
+                    received.set()
+                    return {'type': 'http.request', 'body': body}
+                while chunks is None or len(messages) <= chunks:
+                    await asyncio.sleep(0.01)
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+
+            authorization = 'Token ' + (self.key if key is None else key)
+            await self.handler({
+                'type': 'http', 'method': method, 'path': path,
+                'query_string': b'', 'server': ('testserver', 80),
+                'client': ('127.0.0.1', 50000),
+                'headers': [(b'host', b'testserver'),
+                            (b'authorization', authorization.encode())] +
+                list(headers),
+            }, receive, send)
+
+        asyncio.run(run())
+        return messages[0], b''.join(
+            message.get('body', b'') for message in messages[1:])
+
+    def test_same_payload_as_wsgi(self):
+        api_client = APIClient()
+        api_client.credentials(HTTP_AUTHORIZATION='Token ' + self.key)
+        for path in (MENUS_URL + 'today/', MENUS_URL + 'results/'):
+            start, body = self.request('GET', path)
+            self.assertEqual(start['status'], status.HTTP_200_OK)
+            self.assertEqual(json.loads(body.decode()),
+                             json.loads(api_client.get(path).content.decode()))
+
+    def test_permissions_unchanged(self):
+        start, _ = self.request('GET', MENUS_URL + 'today/', key='invalid')
+        self.assertEqual(start['status'], status.HTTP_403_FORBIDDEN)
+
+    def test_vote(self):
+        start, body = self.request(
+            'POST', MENUS_URL + str(self.menu.pk) + '/vote/', body=b'{}',
+            headers=[(b'content-type', b'application/json')])
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        self.assertTrue(MenuVote.objects.filter(menu=self.menu).exists())
+
+    @mock.patch.object(streaming, 'KEEPALIVE_INTERVAL', 0.05)
+    def test_stream_ends_on_disconnect(self):
+        start, body = self.request(
+            'GET', MENUS_URL + 'results/stream/',
+            headers=[(b'accept', b'text/event-stream')], chunks=1)
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        self.assertTrue(body.startswith(b'event: snapshot\n'))
+        self.assertFalse(streaming.tally_publisher.subscribers)
+
+    def stream_scope(self):
+        return {
+            'type': 'http', 'method': 'GET',
+            'path': MENUS_URL + 'results/stream/', 'query_string': b'',
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+            'headers': [(b'host', b'testserver'),
+                        (b'accept', b'text/event-stream'),
+                        (b'authorization', b'Token ' + self.key.encode())],
+        }
+
+    @mock.patch.object(streaming, 'KEEPALIVE_INTERVAL', 0.05)
+    def test_shutdown_ends_open_streams(self):
+        sent, ticks = [], []
+
+        async def receive():
+            if not sent:
+                return {'type': 'http.request', 'body': b''}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            stream = asyncio.ensure_future(
+                self.handler(self.stream_scope(), receive, send))
+            while len(sent) < 2:
+                await asyncio.sleep(0.01)
+            ticker = asyncio.ensure_future(tick())
+            await self.handler.shutdown(timeout=5)
+            ticker.cancel()
+            return stream.done()
+
+        started = time.perf_counter()
+        self.assertTrue(asyncio.run(run()))
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertTrue(ticks)
+        self.assertFalse(sent[-1].get('more_body'))
+
+    def test_shutdown_gives_up_on_hanging_views(self):
+        release = threading.Event()
+        self.handler.run_view = lambda scope, body: release.wait()
+        done = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def run():
+            asyncio.ensure_future(self.handler(
+                self.stream_scope(), receive, None))
+            await asyncio.sleep(0.05)
+            await self.handler.shutdown(timeout=0.2)
+            done.append(self.handler.open_requests)
+            release.set()
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(done, [1])
+
+    def test_lifespan(self):
+        messages = iter([{'type': 'lifespan.startup'},
+                         {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.handler({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+
+
+class DailyResultTestCase(BaseAPITestCase):
+    URL = '/daily_results/'
+
+    def setUp(self):
+        super().setUp()
+        self.yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        self.day_before = self.yesterday - datetime.timedelta(days=1)
+        voters = [self.admin, User.objects.get(username='employee')]
+        restaurants = [Restaurant.objects.create(name='r%d' % index)
+                       for index in range(3)]
+        self.menus = {}
+        for date, votes in ((self.day_before, (2, 2, 0)),
+                            (self.yesterday, (0, 1, 2))):
+            for restaurant, count in zip(restaurants, votes):
+                menu = Menu.objects.create(restaurant=restaurant, date=date,
+                                           description="Menu")
+                for voter in voters[:count]:
+                    MenuVote.objects.create(menu=menu, user=voter)
+                self.menus[date, restaurant.name] = menu
+
+    def close(self, *args):
+        output = io.StringIO()
+        call_command('close_days', *args, stdout=output)
+        return output.getvalue()
+
+    def ranking(self, date):
+        return list(DailyResult.objects.filter(date=date).order_by(
+            'rank', 'restaurant__name').values_list(
+            'restaurant__name', 'votes', 'rank'))
+
+    def test_close_days_ranks_menus(self):
+        output = self.close('--from', str(self.day_before),
+                            '--chunk-days', '1')
+        self.assertEqual(output.count('Closed'), 2)
+
+        self.assertEqual(self.ranking(self.day_before),
+                         [('r0', 2, 1), ('r1', 2, 1), ('r2', 0, 3)])
+        self.assertEqual(self.ranking(self.yesterday),
+                         [('r2', 2, 1), ('r1', 1, 2), ('r0', 0, 3)])
+
+    def test_close_days_is_idempotent(self):
+        self.close()
+        self.close()
+        self.assertEqual(DailyResult.objects.count(), 3)
+
+        MenuVote.objects.create(menu=self.menus[self.yesterday, 'r0'],
+                                user=self.admin)
+        self.close('--date', str(self.yesterday))
+        self.assertEqual(self.ranking(self.yesterday)[1], ('r0', 1, 2))
+
+    def test_winners_endpoint(self):
+        self.close('--all')
+
+        response = self.user_client.get(self.URL + 'winners/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(result['date'], result['restaurant_name'], result['votes'])
+             for result in response.data['results']],
+            [(str(self.yesterday), 'r2', 2),
+             (str(self.day_before), 'r0', 2),
+             (str(self.day_before), 'r1', 2)])
+
+        response = self.user_client.get(
+            self.URL, {'date_from': str(self.yesterday)})
+        self.assertEqual(len(response.data['results']), 3)
+
+        response = self.user_client.get(self.URL, {'date_to': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ValuesSerializerTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for index in range(3):
+            menu = Menu.objects.create(
+                restaurant=Restaurant.objects.create(name='r%d' % index),
+                date=datetime.date.today() - datetime.timedelta(days=index),
+                description="Menu %d" % index)
+            if index:
+                MenuVote.objects.create(menu=menu, user=self.admin)
+        for index in range(3):
+            APIRequestLog.objects.create(
+                requested_at=now() - datetime.timedelta(seconds=index),
+                path='/menus/', remote_addr='127.0.0.1', host='testserver',
+                method='POST', status_code=201,
+                user=self.admin if index else None)
+
+    def assert_identical(self, url, queryset, serializer_class, **context):
+        response = self.admin_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertTrue(results)
+
+        instances = queryset.in_bulk([result['id'] for result in results])
+        context['request'] = response.wsgi_request
+        expected = serializer_class(
+            [instances[result['id']] for result in results],
+            many=True, context=context).data
+        self.assertEqual(JSONRenderer().render(results),
+                         JSONRenderer().render(expected))
+
+    def test_menus(self):
+        queryset = Menu.objects.for_fields(self.admin, menuview_fields)
+        self.assert_identical(MENUS_URL, queryset, MenuSerializer,
+                              fields=menuview_fields)
+        self.assert_identical('/menus.json', queryset, MenuSerializer,
+                              fields=menuview_fields, format='json')
+
+    def test_menuvotes(self):
+        self.assert_identical(MENUVOTES_URL, MenuVote.objects.all(),
+                              MenuVoteSerializer)
+
+    def test_log_entries(self):
+        self.assert_identical(LOG_ENTRIES_URL, APIRequestLog.objects.all(),
+                              LogEntrySerializer)
+
+    def test_unsupported_fields(self):
+        with self.assertRaises(TypeError):
+            ValuesSerializer(MenuSerializer(context={'request': None}))
+
+
+class HyperlinkFieldTestCase(TestCase):
+
+    def setUp(self):
+        fields._templates.clear()
+        self.menus = [
+            Menu.objects.create(
+                restaurant=Restaurant.objects.create(name='r%d' % index),
+                description="Menu")
+            for index in range(3)
+        ]
+
+    def get_urls(self, field_class, request, format=None):
+        field = field_class(view_name='restaurant-detail', read_only=True)
+        return [field.get_url(menu.restaurant, 'restaurant-detail', request,
+                              format) for menu in self.menus]
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_urls_match_reverse(self):
+        factory = RequestFactory()
+        requests = [factory.get('/'),
+                    factory.get('/', HTTP_HOST='example.com', secure=True)]
+        field_classes = [
+            (fields.HyperlinkedRelatedField,
+             serializers.HyperlinkedRelatedField),
+            (fields.HyperlinkedIdentityField,
+             serializers.HyperlinkedIdentityField),
+        ]
+        for script_prefix in ('/', '/api/'):
+            set_script_prefix(script_prefix)
+            self.addCleanup(set_script_prefix, '/')
+            for request in requests:
+                for format in (None, 'json'):
+                    for cached_class, drf_class in field_classes:
+                        self.assertEqual(
+                            self.get_urls(cached_class, request, format),
+                            self.get_urls(drf_class, request, format))
+
+    def test_reverse_runs_once_per_template(self):
+        request = RequestFactory().get('/')
+        with mock.patch('rest_framework.relations.reverse',
+                        wraps=drf_reverse) as reverse:
+            self.get_urls(fields.HyperlinkedRelatedField, request)
+            self.get_urls(fields.HyperlinkedIdentityField, request)
+        self.assertEqual(reverse.call_count, 1)
+
+
+class KeysetPaginationTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        restaurants = [Restaurant.objects.create(name=str(index))
+                       for index in range(3)]
+        today = datetime.date.today()
+        self.menu_ids = [
+            Menu.objects.create(restaurant=restaurant,
+                                date=today + datetime.timedelta(days=day),
+                                description="Menu description").id
+            for day in (2, 0, 1) for restaurant in restaurants
+        ]
+
+    def collect_pages(self, url, key='next'):
+        pages = []
+        while url:
+            response = self.admin_client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            url = response.data[key]
+        return pages
+
+    def test_menus_are_paginated_by_date_and_id(self):
+        pages = self.collect_pages(MENUS_URL + '?page_size=2')
+        menus = [menu for page in pages for menu in page['results']]
+
+        self.assertEqual(len(pages), 5)
+        self.assertIsNone(pages[0]['previous'])
+        self.assertEqual(
+            [(menu['date'], menu['id']) for menu in menus],
+            sorted((menu['date'], menu['id']) for menu in menus))
+        self.assertEqual(sorted(menu['id'] for menu in menus),
+                         sorted(self.menu_ids))
+
+    def test_menus_previous_links_walk_back(self):
+        last_page = self.collect_pages(MENUS_URL + '?page_size=4')[-1]
+        pages = self.collect_pages(last_page['previous'], key='previous')
+        menus = [menu['id'] for page in reversed(pages)
+                 for menu in page['results']]
+
+        self.assertEqual(len(menus), len(self.menu_ids) - 1)
+        self.assertEqual(len(set(menus)), len(menus))
+
+    def test_log_entries_are_paginated_newest_first(self):
+        pages = self.collect_pages(LOG_ENTRIES_URL + '?page_size=1')
+        entries = [entry for page in pages for entry in page['results']]
+
+        self.assertEqual(len(entries), APIRequestLog.objects.count())
+        self.assertEqual(
+            [entry['id'] for entry in entries],
+            list(APIRequestLog.objects.order_by(
+                '-requested_at', '-id').values_list('id', flat=True)))
+
+    def test_page_size_settings(self):
+        with override_settings(FOOD_POLL_PAGE_SIZE=4):
+            response = self.admin_client.get(MENUS_URL)
+            self.assertEqual(len(response.data['results']), 4)
+        with override_settings(FOOD_POLL_MAX_PAGE_SIZE=3):
+            response = self.admin_client.get(MENUS_URL + '?page_size=5')
+            self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.admin_client.get(MENUS_URL + '?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MenuSearchTestCase(BaseAPITestCase):
+    SEARCH_URL = MENUS_URL + 'search/'
+
+    def setUp(self):
+        super().setUp()
+        restaurant = Restaurant.objects.create(name="Restaurant")
+        today = datetime.date.today()
+        self.menus = {
+            name: Menu.objects.create(
+                restaurant=restaurant, description=description,
+                date=today + datetime.timedelta(days=day))
+            for day, (name, description) in enumerate((
+                ('pizza', "Vegan pizza with grilled vegetables"),
+                ('soup', "Tomato soup and bread"),
+                ('burgers', "Burgers, burgers, burgers and fries"),
+                ('salad', "Grilled chicken salad"),
+            ))
+        }
+
+    def search(self, query, **params):
+        response = self.user_client.get(self.SEARCH_URL,
+                                        dict(params, q=query))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def found(self, query):
+        return [menu['id'] for menu in self.search(query)['results']]
+
+    def test_search_matches_stemmed_words(self):
+        self.assertEqual(self.found('vegetable'), [self.menus['pizza'].id])
+        self.assertEqual(sorted(self.found('grill')), sorted(
+            [self.menus['pizza'].id, self.menus['salad'].id]))
+        self.assertEqual(self.found('grilled chicken'),
+                         [self.menus['salad'].id])
+        self.assertEqual(self.found('sushi'), [])
+
+    def test_results_are_ranked(self):
+        self.menus['soup'].description = "Soup of the day with burgers"
+        self.menus['soup'].save()
+
+        self.assertEqual(self.found('burgers'), [
+            self.menus['burgers'].id, self.menus['soup'].id])
+
+    def test_index_follows_changes(self):
+        self.menus['soup'].description = "Pumpkin soup"
+        self.menus['soup'].save()
+        Menu.objects.filter(pk=self.menus['pizza'].pk).update(
+            description="Pumpkin pie")
+        self.menus['salad'].delete()
+
+        self.assertEqual(self.found('tomato'), [])
+        self.assertEqual(sorted(self.found('pumpkin')), sorted(
+            [self.menus['soup'].id, self.menus['pizza'].id]))
+        self.assertEqual(self.found('chicken'), [])
+
+    def test_query_is_required(self):
+        for query in ('', '  ', '!?'):
+            response = self.user_client.get(self.SEARCH_URL, {'q': query})
+            if query.strip():
+                self.assertEqual(response.data['results'], [])
+            else:
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+                self.assertIn('q', response.data)
+
+    def test_results_are_paginated(self):
+        data = self.search('and', page_size=1)
+        found = [menu['id'] for menu in data['results']]
+        while data['next']:
+            response = self.user_client.get(data['next'])
+            data = response.data
+            found.extend(menu['id'] for menu in data['results'])
+
+        self.assertEqual(sorted(found), sorted(
+            [self.menus['soup'].id, self.menus['burgers'].id]))
+        self.assertEqual(set(self.search('pizza')['results'][0]),
+                         set(menuview_fields))
+
+    @skipUnless(connection.vendor == 'sqlite', "Rebuilds the FTS5 table")
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO food_poll_menu_search"
+                           "(food_poll_menu_search) VALUES ('delete-all')")
+        self.assertEqual(self.found('soup'), [])
+
+        output = io.StringIO()
+        call_command('rebuild_search_index', chunk_size=2, stdout=output)
+
+        self.assertIn("Indexed 4 menus", output.getvalue())
+        self.assertEqual(self.found('soup'), [self.menus['soup'].id])
+        self.assertEqual(len(self.found('grilled')), 2)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Rebuilds the FTS5 table")
+class RebuildSearchIndexTestCase(FileDatabaseMixin, TransactionTestCase):
+
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name="Restaurant")
+        today = datetime.date.today()
+        self.menus = [
+            Menu.objects.create(restaurant=self.restaurant,
+                                date=today + datetime.timedelta(days=day),
+                                description="Tomato soup %d" % day)
+            for day in range(6)]
+
+    def write_menus(self, errors):
+        try:
+            # The first two menus are reindexed, the others aren't yet
+            for menu in (self.menus[0], self.menus[4]):
+                Menu.objects.filter(pk=menu.pk).update(
+                    description="Pumpkin soup")
+            self.menus[1].delete()
+            self.menus[5].delete()
+            Menu.objects.create(restaurant=self.restaurant,
+                                date=datetime.date.today() -
+                                datetime.timedelta(days=1),
+                                description="Pumpkin pie")
+            toggle_vote(self.menus[2].pk, self.user)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    def test_writes_commit_between_chunks(self):
+        self.user = User.objects.create(username='employee')
+        errors, chunks = [], []
+        test = self
+
+        class Output(io.StringIO):
+            def write(self, message):
+                if 'up to id' in message:
+                    chunks.append(message)
+                if len(chunks) == 1 and 'up to id' in message:
+                    writer = threading.Thread(target=test.write_menus,
+                                              args=(errors,))
+                    writer.start()
+                    writer.join(timeout=3)
+                    test.assertFalse(writer.is_alive(),
+                                     "Writes waited for the rebuild")
+                return super().write(message)
+
+        call_command('rebuild_search_index', chunk_size=2, stdout=Output())
+
+        self.assertEqual(errors, [])
+        # The menu created during the rebuild is in the last chunk
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(MenuVote.objects.filter(user=self.user).count(), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO food_poll_menu_search(food_poll_menu_search, "
+                "rank) VALUES ('integrity-check', 1)")
+        self.assertEqual(
+            sorted(Menu.objects.search('pumpkin').values_list(
+                'description', flat=True)),
+            ["Pumpkin pie", "Pumpkin soup", "Pumpkin soup"])
+        self.assertEqual(Menu.objects.search('tomato').count(), 2)
+        self.assertEqual(
+            Menu.objects.search('soup').count(), Menu.objects.count() - 1)
+
+
+class ConcurrentBulkUpsertTestCase(FileDatabaseMixin, TransactionTestCase):
+
+    def test_concurrent_insert_of_a_new_menu(self):
+        restaurant = Restaurant.objects.create(name="Restaurant")
+        date = datetime.date.today()
+        errors = []
+
+        def insert():
+            try:
+                Menu.objects.create(restaurant=restaurant, date=date,
+                                    description="Concurrent")
+            except IntegrityError as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        inserter = threading.Thread(target=insert)
+        bulk_update = MenuQuerySet.bulk_update
+
+        def insert_between_lookup_and_write(queryset, *args, **kwargs):
+            # Runs after bulk_upsert looked up the existing menus
+            inserter.start()
+            time.sleep(0.2)
+            return bulk_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(MenuQuerySet, 'bulk_update', autospec=True,
+                               side_effect=insert_between_lookup_and_write):
+            result = Menu.objects.bulk_upsert([{
+                'restaurant': restaurant.pk, 'date': date,
+                'description': "Uploaded"}])
+        inserter.join()
+
+        self.assertEqual(result, (1, 0))
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(
+            Menu.objects.get(restaurant=restaurant, date=date).description,
+            "Uploaded")
+
+
+class ConcurrentVotingTestCase(FileDatabaseMixin, TransactionTestCase):
+    USERS = 10
+    TOGGLES_PER_USER = 25
+    P99_LATENCY_LIMIT = 2.0
+
+    def setUp(self):
+        restaurant = Restaurant.objects.create(name='test_restaurant')
+        self.menu = Menu.objects.create(restaurant=restaurant,
+                                        description="Menu description")
+        self.users = []
+        for index in range(self.USERS):
+            user = User.objects.create(username='employee_%d' % index)
+            Profile.objects.create(user=user, employee=True)
+            self.users.append(user)
+
+    def toggle(self, user, toggles, latencies, responses):
+        api_client = APIClient()
+        api_client.force_authenticate(user)
+        try:
+            for _ in range(toggles):
+                started = time.perf_counter()
+                response = api_client.post(
+                    MENUS_URL + str(self.menu.id) + '/vote/')
+                latencies.append(time.perf_counter() - started)
+                responses.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_toggles(self):
+        latencies, responses = [], []
+        threads = [
+            threading.Thread(target=self.toggle, args=(
+                user, self.TOGGLES_PER_USER + index % 2,
+                latencies, responses))
+            for index, user in enumerate(self.users)
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(set(responses), {status.HTTP_200_OK})
+        self.assertEqual(len(responses), sum(
+            2 * self.TOGGLES_PER_USER + 2 * (index % 2)
+            for index in range(self.USERS)))
+
+        # Every user toggled an even number of times in total
+        self.assertFalse(MenuVote.objects.filter(menu=self.menu).exists())
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.totalvotes, 0)
+
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        self.assertLess(p99, self.P99_LATENCY_LIMIT)
+
+
+class QueryPlanTestCase(BaseAPITestCase):
+    FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+( AS \S+)?$')
+
+    def setUp(self):
+        super().setUp()
+        self.employee_user = User.objects.get(username='employee')
+        today = datetime.date.today()
+        self.restaurants = [Restaurant.objects.create(name=str(index))
+                            for index in range(5)]
+        for day in range(-3, 4):
+            Menu.objects.bulk_create([
+                Menu(restaurant=restaurant, description="Menu description",
+                     date=today + datetime.timedelta(days=day))
+                for restaurant in self.restaurants])
+        for menu in Menu.objects.filter(date__lte=today):
+            MenuVote.objects.create(user=self.employee_user, menu=menu)
+            MenuVote.objects.create(user=self.admin, menu=menu)
+        Menu.objects.rebuild_totalvotes()
+        self.today_menu = Menu.objects.filter(date=today).first()
+
+    def second_page_url(self, url):
+        response = self.admin_client.get(url + '?page_size=1')
+        return response.data['next']
+
+    def assert_no_full_scans(self, api_client, method, url, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(api_client, method)(url, *args, **kwargs)
+        self.assertLess(response.status_code, 300, url)
+
+        for query in data_queries(queries):
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans = [step for step in plan if self.FULL_SCAN.match(step)]
+            self.assertEqual(scans, [], '%s %s: %s' % (
+                method.upper(), url, query['sql']))
+
+    @skipUnless(connection.vendor == 'sqlite', "Uses SQLite query plans")
+    def test_hot_endpoints_use_indexes(self):
+        restaurant_id = self.today_menu.restaurant_id
+        for api_client in (self.user_client, self.admin_client):
+            for url in (MENUS_URL + 'today/', MENUS_URL + 'results/',
+                        RESTAURANTS_URL + str(restaurant_id) + '/today/',
+                        MENUS_URL + str(self.today_menu.id) + '/'):
+                self.assert_no_full_scans(api_client, 'get', url)
+
+        for url in (MENUS_URL, MENUVOTES_URL, LOG_ENTRIES_URL):
+            self.assert_no_full_scans(self.admin_client, 'get',
+                                      self.second_page_url(url))
+
+        self.assert_no_full_scans(
+            client, 'post', MENUS_URL + str(self.today_menu.id) + '/vote/',
+            **EMPLOYEE_AUTH_HEADERS)
+        self.assert_no_full_scans(
+            client, 'post', MENUS_URL + 'votes/batch/',
+            [{'menu': self.today_menu.id, 'voted': True}], format='json',
+            **EMPLOYEE_AUTH_HEADERS)
+
+
+class MenuFilterTestCase(BaseAPITestCase):
+    FULL_SCAN = QueryPlanTestCase.FULL_SCAN
+
+    def setUp(self):
+        super().setUp()
+        self.employee_user = User.objects.get(username='employee')
+        self.today = datetime.date.today()
+        self.restaurants = [Restaurant.objects.create(name=str(index))
+                            for index in range(3)]
+        for day in range(-3, 4):
+            Menu.objects.bulk_create([
+                Menu(restaurant=restaurant, description="Menu description",
+                     date=self.today + datetime.timedelta(days=day))
+                for restaurant in self.restaurants])
+        self.voted = list(Menu.objects.filter(
+            restaurant=self.restaurants[0], date__lte=self.today))
+        for menu in self.voted:
+            MenuVote.objects.create(user=self.employee_user, menu=menu)
+        self.employee_client = APIClient()
+        self.employee_client.force_authenticate(self.employee_user)
+
+    def filter(self, **params):
+        response = self.employee_client.get(MENUS_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [menu['id'] for menu in response.data['results']]
+
+    def expected(self, **filters):
+        return list(Menu.objects.filter(**filters).order_by(
+            'date', 'id').values_list('id', flat=True))
+
+    def test_date_range(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        self.assertEqual(
+            self.filter(date_from=self.today, date_to=tomorrow),
+            self.expected(date__gte=self.today, date__lte=tomorrow))
+        self.assertEqual(self.filter(date_from=tomorrow),
+                         self.expected(date__gte=tomorrow))
+
+    def test_restaurants(self):
+        restaurants = [self.restaurants[0].id, self.restaurants[2].id]
+        self.assertEqual(self.filter(restaurant=restaurants),
+                         self.expected(restaurant__in=restaurants))
+        self.assertEqual(
+            self.filter(restaurant='%d,%d' % tuple(restaurants)),
+            self.expected(restaurant__in=restaurants))
+
+    def test_voted(self):
+        voted = [menu.id for menu in self.voted]
+        self.assertEqual(self.filter(voted='true'), voted)
+        self.assertEqual(self.filter(voted='false'), [
+            menu_id for menu_id in self.expected() if menu_id not in voted])
+
+    def test_invalid_params(self):
+        for params in ({'date_from': 'yesterday'}, {'restaurant': 'first'},
+                       {'voted': 'maybe'}):
+            response = self.employee_client.get(MENUS_URL, params)
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+            self.assertIn(list(params)[0], response.data)
+
+    @skipUnless(connection.vendor == 'sqlite', "Uses SQLite query plans")
+    def test_filters_run_as_one_indexed_query(self):
+        restaurants = [restaurant.id for restaurant in self.restaurants[:2]]
+        with CaptureQueriesContext(connection) as queries:
+            found = self.filter(
+                date_from=self.today - datetime.timedelta(days=7),
+                date_to=self.today, restaurant=restaurants, voted='true')
+
+        self.assertEqual(found, [menu.id for menu in self.voted])
+        menu_queries = [query['sql'] for query in data_queries(queries)
+                        if 'FROM "food_poll_menu"' in query['sql']]
+        self.assertEqual(len(menu_queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + menu_queries[0])
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertEqual(
+            [step for step in plan if self.FULL_SCAN.match(step)], [])
+        self.assertTrue(any(
+            step.startswith('SEARCH food_poll_menu USING') and
+            'restaurant_id=?' in step and 'date>' in step
+            for step in plan), plan)
+
+
+class DatabaseConfigTestCase(FileDatabaseMixin, TestCase):
+    @skipUnless(connection.vendor == 'sqlite', "SQLite PRAGMAs")
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    @skipUnless(connection.vendor == 'sqlite', "SQLite PRAGMAs")
+    def test_committed_database_keeps_rollback_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'db.sqlite3')
+            committed = connections['default'].__class__(
+                dict(connection.settings_dict, NAME=name), 'committed')
+            with override_settings(
+                    FOOD_POLL_SQLITE_COMMITTED_DATABASES=[name]), \
+                    committed.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'delete')
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 5000)
+            committed.close()
+
+    @override_settings(FOOD_POLL_DB_HEALTH_CHECKS=True)
+    def test_health_check_closes_unusable_connection(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            database.check_persistent_connections()
+            self.assertFalse(close.called)
+
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                database.check_persistent_connections()
+            close.assert_called_once_with()
+
+
+class ReplicaTestCase(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        replica_file = tempfile.NamedTemporaryFile(suffix='.sqlite3',
+                                                   delete=False)
+        replica_file.close()
+        self.replica_name = replica_file.name
+        connections.databases[routers.REPLICA_ALIAS] = dict(
+            connections.databases['default'], NAME=self.replica_name)
+
+        self.user = User.objects.create_user('employee', password='employee')
+        self.api_client = APIClient()
+        self.api_client.force_authenticate(self.user)
+        Restaurant.objects.create(name='synced')
+        call_command('sync_replica', stdout=io.StringIO())
+        Restaurant.objects.create(name='not synced')
+
+    def tearDown(self):
+        connections[routers.REPLICA_ALIAS].close()
+        del connections[routers.REPLICA_ALIAS]
+        del connections.databases[routers.REPLICA_ALIAS]
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.replica_name + suffix):
+                os.remove(self.replica_name + suffix)
+
+    def restaurant_names(self):
+        response = self.api_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [restaurant['name'] for restaurant in response.data]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.restaurant_names(), ['synced'])
+        self.assertEqual(Restaurant.objects.count(), 2)
+
+    def test_sticks_to_primary_after_write(self):
+        response = self.api_client.post(RESTAURANTS_URL, {'name': 'new'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.restaurant_names(),
+                         ['synced', 'not synced', 'new'])
+
+        cache.delete(routers.sticky_key(self.user.pk))
+        self.assertEqual(self.restaurant_names(), ['synced'])
+
+    def test_writes_go_to_primary(self):
+        with routers.read_from(True):
+            restaurant = Restaurant.objects.get(name='synced')
+            restaurant.name = 'renamed'
+            restaurant.save()
+        self.assertEqual(restaurant._state.db, 'default')
+        self.assertTrue(Restaurant.objects.filter(name='renamed').exists())
+        self.assertTrue(Restaurant.objects.using(
+            routers.REPLICA_ALIAS).filter(name='synced').exists())
+
+
+class LogsDatabaseTestCase(TransactionTestCase):
+
+    def setUp(self):
+        logs_file = tempfile.NamedTemporaryFile(suffix='.sqlite3',
+                                                delete=False)
+        logs_file.close()
+        self.logs_name = logs_file.name
+        connections.databases[routers.LOGS_ALIAS] = dict(
+            connections.databases['default'], NAME=self.logs_name)
+        call_command('migrate', database=routers.LOGS_ALIAS, verbosity=0)
+        connections[routers.LOGS_ALIAS].close()
+
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'admin')
+        self.api_client = APIClient()
+        self.api_client.force_authenticate(self.admin)
+
+    def tearDown(self):
+        connections[routers.LOGS_ALIAS].close()
+        del connections[routers.LOGS_ALIAS]
+        del connections.databases[routers.LOGS_ALIAS]
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.logs_name + suffix):
+                os.remove(self.logs_name + suffix)
+
+    def test_logs_written_to_logs_database(self):
+        response = self.api_client.post(RESTAURANTS_URL, {'name': 'logged'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        entries = APIRequestLog.objects.select_related(None)
+        self.assertEqual(entries.db, routers.LOGS_ALIAS)
+        self.assertEqual(list(entries.values_list('path', 'user_id')),
+                         [(RESTAURANTS_URL, self.admin.pk)])
+        self.assertFalse(APIRequestLog.objects.using('default').exists())
+
+        response = self.api_client.get(LOG_ENTRIES_URL)
+        self.assertEqual([entry['path'] for entry in response.data['results']],
+                         [RESTAURANTS_URL])
+        response = self.api_client.get(response.data['results'][0]['url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deleting_user_detaches_log_entries(self):
+        user = User.objects.create_user('employee', password='employee')
+        api_client = APIClient()
+        api_client.force_authenticate(user)
+        api_client.post(RESTAURANTS_URL, {'name': 'logged'})
+
+        user.delete()
+        self.assertEqual(list(APIRequestLog.objects.select_related(
+            None).values_list('user_id', flat=True)), [None])
+
+    def test_migrations_routed(self):
+        router = routers.LogsRouter()
+        self.assertTrue(router.allow_migrate(
+            routers.LOGS_ALIAS, 'rest_framework_tracking'))
+        self.assertTrue(router.allow_migrate(
+            routers.LOGS_ALIAS, 'food_poll', model_name='apirequestlog'))
+        self.assertFalse(router.allow_migrate(
+            routers.LOGS_ALIAS, 'food_poll', model_name='menu'))
+        self.assertIsNone(router.allow_migrate(
+            'default', 'rest_framework_tracking'))
+        with connections[routers.LOGS_ALIAS].cursor() as cursor:
+            tables = connections[
+                routers.LOGS_ALIAS].introspection.table_names(cursor)
+        self.assertIn('rest_framework_tracking_apirequestlog', tables)
+        self.assertNotIn('food_poll_menu', tables)
+
+
+class BenchmarkCommandTestCase(TestCase):
+    def test_benchmark_endpoints(self):
+        output = io.StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.json') as results_file:
+            call_command('benchmark_endpoints', restaurants=2, days=2,
+                         employees=3, log_entries=5, repeat=1,
+                         use_current_db=True, output=results_file.name,
+                         stdout=output)
+            results = json.load(results_file)
+
+        self.assertEqual(results['meta']['employees'], 3)
+        endpoints = results['endpoints']
+        for name in ('menu-list', 'menu-today', 'menu-vote',
+                     'restaurant-today', 'apirequestlog-list'):
+            self.assertIn(name, endpoints)
+            self.assertEqual(set(endpoints[name]), {'admin', 'employee'})
+        self.assertEqual(endpoints['menu-list']['admin']['status'], 200)
+
+    def test_benchmark_serializers(self):
+        output = io.StringIO()
+        call_command('benchmark_serializers', rows=200, repeat=1,
+                     use_current_db=True, stdout=output)
+        self.assertRegex(output.getvalue(), r'menuvotes\s+200\s')
+
+
 class MenuVoteAPITestCase(MenuAPITestCase):
 
     def setUp(self):
@@ -361,6 +1979,7 @@ class MenuVoteAPITestCase(MenuAPITestCase):
 
         user = User.objects.filter(id=self.user.get('id')).first()
         self.menuvote = MenuVote.objects.create(user=user, menu=self.menu)
+        Menu.objects.filter(pk=self.menu.pk).add_votes(1)
         self.MENUVOTE_URL = MENUVOTES_URL + str(self.menuvote.id) + '/'
 
     def test_menuvote_create(self):
@@ -515,6 +2134,101 @@ class LogEntryAPITestCase(MenuVoteAPITestCase):
         check_responses(self, responses, status_codes)
 
 
+class BufferedLogWriterTestCase(TestCase):
+
+    def create_log(self):
+        return APIRequestLog(requested_at=now(), path=MENUS_URL,
+                             remote_addr='127.0.0.1', host='testserver',
+                             method='POST')
+
+    def test_flush_writes_queued_logs_in_batches(self):
+        writer = logwriter.BufferedLogWriter(APIRequestLog, batch_size=2)
+        for _ in range(5):
+            self.assertTrue(writer.submit(self.create_log()))
+        self.assertEqual(APIRequestLog.objects.count(), 0)
+
+        writer.flush()
+
+        stats = writer.stats()
+        self.assertEqual(APIRequestLog.objects.count(), 5)
+        self.assertEqual(stats['written'], 5)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(stats['queued'], 0)
+        self.assertIsNotNone(stats['last_flush_ms'])
+
+    def test_drop_policy(self):
+        writer = logwriter.BufferedLogWriter(
+            APIRequestLog, max_queue_size=2, policy='drop')
+        results = [writer.submit(self.create_log()) for _ in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(writer.stats()['dropped'], 1)
+
+    def test_sample_policy(self):
+        writer = logwriter.BufferedLogWriter(
+            APIRequestLog, max_queue_size=4, policy='sample', sample_rate=0)
+        results = [writer.submit(self.create_log()) for _ in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(writer.stats()['sampled_out'], 1)
+
+    def test_block_policy_gives_up(self):
+        writer = logwriter.BufferedLogWriter(
+            APIRequestLog, max_queue_size=1, policy='block',
+            block_timeout=0.05)
+        running = threading.Event()
+        writer._thread = threading.Thread(target=running.wait)
+        writer._thread.start()
+        self.assertTrue(writer.submit(self.create_log()))
+        started = time.monotonic()
+        with self.assertLogs('food_poll.logwriter', 'WARNING'):
+            self.assertFalse(writer.submit(self.create_log()))
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        running.set()
+        writer._thread.join()
+
+        # Without a live writer thread nothing would free space
+        started = time.monotonic()
+        with self.assertLogs('food_poll.logwriter', 'WARNING'):
+            self.assertFalse(writer.submit(self.create_log()))
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertEqual(writer.stats()['dropped'], 2)
+
+
+class BufferedLoggingAPITestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.writer = logwriter.BufferedLogWriter(APIRequestLog)
+        logwriter._writer = self.writer
+
+    def tearDown(self):
+        logwriter._writer = None
+
+    def test_logs_are_written_on_flush(self):
+        with override_settings(FOOD_POLL_LOG_MODE='buffered'):
+            log_count = APIRequestLog.objects.count()
+            response = self.user_client.post(RESTAURANTS_URL,
+                                             {'name': 'test_restaurant'})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(APIRequestLog.objects.count(), log_count)
+
+            response = self.admin_client.get(LOG_ENTRIES_URL + 'writer/')
+            self.assertEqual(response.data['mode'], 'buffered')
+            self.assertEqual(response.data['queued'], 1)
+
+            self.writer.flush()
+            self.assertEqual(APIRequestLog.objects.count(), log_count + 1)
+
+    def test_writer_stats_in_sync_mode(self):
+        response = self.admin_client.get(LOG_ENTRIES_URL + 'writer/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'mode': 'sync'})
+
+        response = self.user_client.get(LOG_ENTRIES_URL + 'writer/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
 class UserAPITestCase(RestaurantAPITestCase):
 
     def setUp(self):
@@ -627,6 +2341,140 @@ class UserAPITestCase(RestaurantAPITestCase):
             APIRequestLog.objects.filter(user_id=value.get('id')).delete()
 
 
+class AuthTokenAPITestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        response = self.user_client.post(USERS_URL + 'token/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.key = response.data['token']
+        self.token_client = APIClient()
+        self.token_client.credentials(HTTP_AUTHORIZATION='Token ' + self.key)
+
+    def test_token_is_stored_hashed(self):
+        token = AuthToken.objects.get()
+        self.assertEqual(token.user_id, self.user['id'])
+        self.assertNotEqual(token.digest, self.key)
+        self.assertNotIn(self.key, ''.join(
+            APIRequestLog.objects.values_list('response', flat=True)))
+
+    def test_authenticate_with_token(self):
+        response = self.token_client.get(USERS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['id'] for user in response.data],
+                         [self.user['id']])
+
+    def test_cached_token_skips_lookup(self):
+        self.token_client.get(RESTAURANTS_URL)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.token_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'food_poll_authtoken' in query['sql']])
+
+    def test_invalid_token(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        response = client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_rotate_token(self):
+        self.token_client.get(RESTAURANTS_URL)
+        response = self.token_client.post(USERS_URL + 'token/rotate/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        key = response.data['token']
+        self.assertNotEqual(key, self.key)
+
+        response = self.token_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.token_client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        response = self.token_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rotate_requires_token(self):
+        response = self.user_client.post(USERS_URL + 'token/rotate/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revoke_token(self):
+        self.token_client.get(RESTAURANTS_URL)
+        response = self.token_client.post(USERS_URL + 'token/revoke/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(AuthToken.objects.exists())
+
+        response = self.token_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revoke_all_tokens(self):
+        self.user_client.post(USERS_URL + 'token/')
+        response = self.user_client.post(USERS_URL + 'token/revoke/',
+                                         {'all': True})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(AuthToken.objects.exists())
+
+    def test_revoke_only_current_token_with_all_false(self):
+        self.user_client.post(USERS_URL + 'token/')
+        response = self.token_client.post(USERS_URL + 'token/revoke/',
+                                          {'all': 'false'})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(AuthToken.objects.count(), 1)
+
+        response = self.user_client.post(USERS_URL + 'token/revoke/',
+                                         {'all': 'maybe'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(AuthToken.objects.count(), 1)
+
+    def test_deactivated_user_loses_cached_token(self):
+        self.token_client.get(RESTAURANTS_URL)
+        User.objects.filter(pk=self.user['id']).update(is_active=False)
+        User.objects.get(pk=self.user['id']).save()
+
+        response = self.token_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['food_poll.backends.CachedModelBackend'])
+class CachedSessionTestCase(BaseAPITestCase):
+
+    def session_queries(self, client, url=RESTAURANTS_URL):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in queries.captured_queries
+                if 'django_session' in query['sql'] or
+                'auth_user' in query['sql']]
+
+    def test_cached_session_and_user(self):
+        self.assertTrue(self.session_queries(self.user_client))
+        self.assertEqual(self.session_queries(self.user_client), [])
+
+    def test_user_save_invalidates(self):
+        self.session_queries(self.user_client)
+        user = User.objects.get(pk=self.user['id'])
+        user.username = 'renamed'
+        user.save()
+
+        response = self.user_client.get(USERS_URL)
+        self.assertEqual(response.data[0]['username'], 'renamed')
+
+        user.is_active = False
+        user.save()
+        response = self.user_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_password_change_ends_session(self):
+        self.session_queries(self.user_client)
+        user = User.objects.get(pk=self.user['id'])
+        user.set_password('changed')
+        user.save()
+
+        response = self.user_client.get(RESTAURANTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
 class ProfileAPITestCase(RestaurantAPITestCase):
 
     def setUp(self):
@@ -698,6 +2546,20 @@ class ProfileAPITestCase(RestaurantAPITestCase):
         check_responses(self, responses, status_codes)
 
 
+def run_commit_hooks():
+    """
+    Runs the on_commit() callbacks held back by TestCase's transaction.
+    """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
+def data_queries(queries):
+    return [query for query in queries.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+
 def check_responses(instance, responses, status_codes):
     instance.assertEqual(responses['anonymous'].status_code,
                          status_codes['anonymous'])
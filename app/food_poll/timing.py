@@ -0,0 +1,44 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class RequestTiming(object):
+    """
+    Wall time spent in the named phases of a request. Nested or repeated
+    entries of the same phase are added up, but a phase entered while it
+    is already running isn't counted twice.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._running = set()
+
+    @contextmanager
+    def phase(self, name):
+        if name in self._running:
+            yield
+            return
+
+        self._running.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._running.discard(name)
+            self.phases[name] = self.phases.get(name, 0) + \
+                time.perf_counter() - started
+
+
+def get_timing(request):
+    return getattr(request, 'server_timing', None)
+
+
+@contextmanager
+def timed(request, name):
+    timing = get_timing(request)
+    if timing is None:
+        yield
+    else:
+        with timing.phase(name):
+            yield
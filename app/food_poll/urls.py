@@ -6,6 +6,7 @@ router = routers.DefaultRouter()
 router.register('restaurants', views.RestaurantView)
 router.register('menus', views.MenuView)
 router.register('menuvotes', views.MenuVoteView, base_name='menuvote')
+router.register('daily_results', views.DailyResultView)
 router.register('users', views.UserViewSet)
 router.register('profile', views.ProfileViewSet)
 router.register('log_entries', views.LogEntryView)
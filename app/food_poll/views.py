@@ -1,117 +1,350 @@
 import datetime
-
-from django.contrib.auth.models import User
-from django.http import QueryDict
+import json
+from collections import OrderedDict
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import IntegrityError, transaction
+from django.http import QueryDict, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import list_route, action
 from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework_tracking.models import APIRequestLog
 
-from .mixins import ConfiguredLoggingMixin
-from .helpers import get_updated_serializer_fields, get_permissions_by_action
+from .conditional import restaurant_today_etag, restaurants_etag, \
+    todays_menus_etag
+from .logwriter import get_log_writer
+from .menucache import get_or_build, menu_cache_key
+from .mixins import ConfiguredLoggingMixin, ReplicaReadMixin, \
+    TimedViewMixin, ValuesListMixin
+from .pagination import MenuPagination, MenuVotePagination, \
+    LogEntryPagination, DailyResultPagination, MenuSearchPagination
+from .helpers import get_updated_serializer_fields, \
+    get_permissions_by_action, get_date_param, get_id_list_param, \
+    get_bool_param, get_bool_data
 from .permissions import IsRestaurantEmployee, IsEmployee, IsUser
-from .models import Restaurant, Menu, Profile, MenuVote
+from .principal import get_principal
+from .models import Restaurant, Menu, Profile, MenuVote, DailyResult, \
+    AuthToken
+from .streaming import EventStreamRenderer, tally_publisher, \
+    tally_stream
+from .voting import toggle_vote, apply_votes
 from .serializers import RestaurantSerializer, MenuSerializer, \
-    MenuVoteSerializer, ProfileSerializer, UserSerializer, LogEntrySerializer
+    MenuVoteSerializer, ProfileSerializer, UserSerializer, \
+    LogEntrySerializer, VoteIntentSerializer, MenuRowSerializer, \
+    DailyResultSerializer, ValuesSerializer
 
 menuview_fields = ['id', 'url', 'restaurant', 'date', 'description', 'voted']
 
+# Fields that change with every vote and are never cached
+menu_vote_fields = ['voted', 'totalvotes', 'menuvotes']
+
+
+def vote_conflict_response():
+    # Concurrent requests kept changing the same votes, even after a retry
+    return Response({'detail': "The vote was changed by another request, "
+                               "please try again"},
+                    status=status.HTTP_409_CONFLICT)
+
 
-class RestaurantView(ConfiguredLoggingMixin, viewsets.ModelViewSet):
+class RestaurantView(TimedViewMixin, ReplicaReadMixin,
+                     ConfiguredLoggingMixin, viewsets.ModelViewSet):
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
     permission_classes = (
         permissions.IsAuthenticated,
         IsRestaurantEmployee | permissions.DjangoObjectPermissions,)
 
+    @method_decorator(condition(etag_func=restaurants_etag))
+    def list(self, request, *args, **kwargs):
+        return super(RestaurantView, self).list(request, *args, **kwargs)
+
     @action(detail=True)
+    @method_decorator(condition(etag_func=restaurant_today_etag))
     def today(self, request, *args, **kwargs):
-        queryset = Menu.objects.filter(restaurant=kwargs.get('pk'),
-                                       date=datetime.date.today()).first()
+        queryset = Menu.objects.filter(
+            restaurant=kwargs.get('pk'), date=datetime.date.today()
+        ).for_fields(request.user, menuview_fields).first()
         data = MenuSerializer(queryset, context={
             'request': self.request, 'fields': menuview_fields},)
         return Response(data.data)
 
 
-class MenuView(ConfiguredLoggingMixin, viewsets.ModelViewSet):
+class MenuView(TimedViewMixin, ReplicaReadMixin, ValuesListMixin,
+               ConfiguredLoggingMixin, viewsets.ModelViewSet):
     queryset = Menu.objects.all()
     serializer_class = MenuSerializer
+    pagination_class = MenuPagination
     permission_classes = (
         permissions.IsAuthenticated,
         IsRestaurantEmployee | permissions.DjangoObjectPermissions,)
 
     def retrieve(self, request, *args, **kwargs):
-        queryset = self.queryset.filter(id=kwargs.get('pk')).first()
+        queryset = self.queryset.filter(id=kwargs.get('pk')).for_fields(
+            request.user, menuview_fields).first()
         serializer = MenuSerializer(queryset, context={
             'request': request,
             'fields': menuview_fields
         })
         return Response(serializer.data)
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.queryset
-        serializer = MenuSerializer(queryset, context={
-            'request': request,
+    def get_values_serializer(self):
+        return ValuesSerializer(MenuSerializer(context={
+            'request': self.request,
+            'format': self.format_kwarg,
             'fields': menuview_fields
-        }, many=True)
-
-        return Response(serializer.data)
+        }))
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.filter_menus(self.queryset.for_fields(
+                self.request.user, menuview_fields))
+        if self.action == 'search':
+            query = self.request.query_params.get('q', '').strip()
+            if not query:
+                raise ValidationError({'q': ["This field is required."]})
+            return self.queryset.search(query).for_fields(
+                self.request.user, menuview_fields)
+        return super(MenuView, self).get_queryset()
+
+    def filter_menus(self, queryset):
+        """
+        Applies the `date_from`, `date_to`, `restaurant` and `voted` query
+        parameters; all of them end up in the WHERE clause of the page query.
+        """
+        date_from = get_date_param(self.request, 'date_from')
+        date_to = get_date_param(self.request, 'date_to')
+        restaurants = get_id_list_param(self.request, 'restaurant')
+        voted = get_bool_param(self.request, 'voted')
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        if restaurants:
+            queryset = queryset.filter(restaurant_id__in=restaurants)
+        if voted is not None:
+            queryset = queryset.filter(voted=voted)
+        return queryset
+
+    def todays_menus(self, request, name, fields):
+        """
+        Today's menus serialized with `fields`. The vote-independent part of
+        the payload is cached for all users with the same field set; the
+        requesting user's `voted` flags and the vote counts are looked up
+        per request, so votes don't invalidate the cache.
+        """
+        today = datetime.date.today()
+        cached_fields = [field for field in fields
+                         if field not in menu_vote_fields]
+
+        def build():
+            queryset = self.queryset.filter(date=today).for_fields(
+                AnonymousUser(), cached_fields)
+            serializer = MenuSerializer(queryset, context={
+                'request': request,
+                'fields': cached_fields
+            }, many=True)
+            return json.loads(JSONRenderer().render(serializer.data))
+
+        menus = get_or_build(menu_cache_key(
+            name, today, request.user.is_superuser,
+            request.build_absolute_uri('/')), build)
+        votes = {
+            menu_id: (voted, totalvotes)
+            for menu_id, voted, totalvotes in self.queryset.filter(
+                date=today).with_voted(request.user).order_by().values_list(
+                'id', 'voted', 'totalvotes')
+        }
+        menuvotes = {}
+        if 'menuvotes' in fields:
+            queryset = MenuVote.objects.filter(
+                menu__date=today).order_by('pk')
+            data = MenuVoteSerializer(
+                queryset, context={'request': request}, many=True).data
+            for vote, item in zip(queryset, data):
+                menuvotes.setdefault(vote.menu_id, []).append(item)
+
+        result = []
+        for menu in menus:
+            voted, totalvotes = votes.get(menu['id'], (False, 0))
+            menu = dict(menu, voted=voted)
+            if 'totalvotes' in fields:
+                menu['totalvotes'] = totalvotes
+            if 'menuvotes' in fields:
+                menu['menuvotes'] = menuvotes.get(menu['id'], [])
+            result.append(menu)
+        return result
+
+    @action(detail=False, pagination_class=MenuSearchPagination)
+    def search(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
 
     @list_route()
     def results(self, request, *args, **kwargs):
-        queryset = self.queryset.filter(date=datetime.date.today())
-
         fields = get_updated_serializer_fields(
             menuview_fields + ['totalvotes'],
             request.user.is_superuser, ['menuvotes']
         )
-        serializer = MenuSerializer(queryset, context={
-            'request': request,
-            'fields': fields
-        }, many=True)
-
-        return Response(serializer.data)
+        return Response(self.todays_menus(request, 'results', fields))
+
+    @action(detail=False, url_path='results/stream',
+            renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def results_stream(self, request, *args, **kwargs):
+        def snapshot():
+            return self.queryset.filter(
+                date=datetime.date.today()).order_by('pk').values_list(
+                'id', 'totalvotes')
+
+        response = StreamingHttpResponse(
+            tally_stream(tally_publisher, snapshot),
+            content_type=EventStreamRenderer.media_type)
+        response['Cache-Control'] = 'no-cache'
+        return response
 
     @list_route()
+    @method_decorator(condition(etag_func=todays_menus_etag))
     def today(self, request, *args, **kwargs):
-        queryset = self.queryset.filter(date=datetime.date.today())
-        serializer = MenuSerializer(queryset, context={
-            'request': request,
-            'fields': menuview_fields
-        }, many=True)
-
-        return Response(serializer.data)
+        return Response(self.todays_menus(request, 'today', menuview_fields))
 
     @action(detail=True, methods=['post'], permission_classes=[
         permissions.IsAuthenticatedOrReadOnly, IsEmployee])
     def vote(self, request, pk):
-        menuvote = MenuVote.objects.filter(menu=pk, user=request.user).first()
-        menu = Menu.objects.filter(pk=pk).first()
-        if menuvote:
-            menuvote.delete()
-            return Response({
-                'voted': False,
-                'message': "Vote for " + str(menu) + " removed"
-            })
-        elif menu:
-            MenuVote.objects.create(user=request.user, menu=menu)
-            return Response({
-                'voted': True,
-                'message': "You have voted for " + str(menu) + " lunch menu"
-            })
-        raise ValidationError("Menu was not found")
-
-
-class MenuVoteView(viewsets.ModelViewSet):
+        try:
+            result = toggle_vote(int(pk), request.user)
+        except (ValueError, Menu.DoesNotExist):
+            raise ValidationError("Menu was not found")
+        except IntegrityError:
+            return vote_conflict_response()
+        tally_publisher.publish({int(pk): result.totalvotes})
+        if result.voted:
+            message = "You have voted for " + result.menu_name + " lunch menu"
+        else:
+            message = "Vote for " + result.menu_name + " removed"
+        return Response({
+            'voted': result.voted,
+            'totalvotes': result.totalvotes,
+            'message': message
+        })
+
+    @action(detail=False, methods=['post'], url_path='votes/batch',
+            permission_classes=[permissions.IsAuthenticatedOrReadOnly,
+                                IsEmployee])
+    def votes_batch(self, request):
+        serializer = VoteIntentSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        menu_ids = {item['menu'] for item in serializer.validated_data}
+        found = set(Menu.objects.filter(
+            pk__in=menu_ids).values_list('id', flat=True))
+        errors = [
+            {} if item['menu'] in found else
+            {'menu': ["Menu was not found"]}
+            for item in serializer.validated_data
+        ]
+        if any(errors):
+            raise ValidationError(errors)
+
+        intents = OrderedDict(
+            (item['menu'], item['voted'])
+            for item in serializer.validated_data)
+        try:
+            totals = apply_votes(intents, request.user)
+        except IntegrityError:
+            return vote_conflict_response()
+        tally_publisher.publish(totals)
+
+        return Response([{
+            'menu': menu_id,
+            'voted': voted,
+            'totalvotes': totals.get(menu_id)
+        } for menu_id, voted in intents.items()])
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of menus")
+
+        rows, errors = [], {}
+        for index, row in enumerate(request.data):
+            serializer = MenuRowSerializer(data=row)
+            if serializer.is_valid():
+                rows.append((index, serializer.validated_data))
+            else:
+                errors[index] = serializer.errors
+
+        if request.user.is_superuser:
+            restaurant_ids = set(Restaurant.objects.filter(
+                pk__in={row['restaurant'] for _, row in rows}
+            ).values_list('id', flat=True))
+        else:
+            restaurant_ids = get_principal(request).restaurant_ids
+
+        seen = set()
+        for index, row in list(rows):
+            key = (row['restaurant'], row['date'])
+            if row['restaurant'] not in restaurant_ids:
+                errors[index] = {'restaurant': [
+                    "User is not an employee of restaurant " +
+                    str(row['restaurant'])]}
+            elif key in seen:
+                errors[index] = {'non_field_errors': [
+                    "Duplicate menu for this restaurant and date"]}
+            seen.add(key)
+        rows = [row for index, row in rows if index not in errors]
+
+        all_or_nothing = request.query_params.get('atomic', '').lower() in \
+            ('1', 'true')
+        if errors and (all_or_nothing or not rows):
+            return Response({'created': 0, 'updated': 0, 'errors': errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        created, updated = Menu.objects.bulk_upsert(rows)
+        return Response({
+            'created': created,
+            'updated': updated,
+            'errors': errors
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class MenuVoteView(TimedViewMixin, ReplicaReadMixin, ValuesListMixin,
+                   viewsets.ModelViewSet):
     queryset = MenuVote.objects.all()
     serializer_class = MenuVoteSerializer
+    pagination_class = MenuVotePagination
     permission_classes = (permissions.IsAdminUser,)
     http_method_names = ['get', 'options', 'head']
 
 
-class UserViewSet(ConfiguredLoggingMixin, viewsets.ModelViewSet):
-    queryset = User.objects.all()
+class DailyResultView(TimedViewMixin, ReplicaReadMixin,
+                      viewsets.ModelViewSet):
+    queryset = DailyResult.objects.select_related('restaurant')
+    serializer_class = DailyResultSerializer
+    pagination_class = DailyResultPagination
+    http_method_names = ['get', 'options', 'head']
+
+    def get_queryset(self):
+        queryset = self.queryset
+        date_from = get_date_param(self.request, 'date_from')
+        date_to = get_date_param(self.request, 'date_to')
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        return queryset
+
+    @action(detail=False)
+    def winners(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset().filter(rank=1))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class UserViewSet(TimedViewMixin, ReplicaReadMixin, ConfiguredLoggingMixin,
+                  viewsets.ModelViewSet):
+    queryset = User.objects.select_related('profile')
     serializer_class = UserSerializer
     permission_classes_by_action = {
         'create': [],
@@ -123,7 +356,10 @@ class UserViewSet(ConfiguredLoggingMixin, viewsets.ModelViewSet):
         'update': [
             IsUser | permissions.DjangoObjectPermissions
         ],
-        'destroy': [IsUser | permissions.DjangoObjectPermissions]
+        'destroy': [IsUser | permissions.DjangoObjectPermissions],
+        'token': [permissions.IsAuthenticated],
+        'rotate_token': [permissions.IsAuthenticated],
+        'revoke_token': [permissions.IsAuthenticated],
      }
 
     def list(self, request, *args, **kwargs):
@@ -156,9 +392,36 @@ class UserViewSet(ConfiguredLoggingMixin, viewsets.ModelViewSet):
         serialized = UserSerializer(serialized, context={'request': request})
         return Response(serialized.data, status=status.HTTP_201_CREATED)
 
-
-class ProfileViewSet(ConfiguredLoggingMixin, viewsets.ModelViewSet):
-    queryset = Profile.objects.all()
+    @action(detail=False, methods=['post'])
+    def token(self, request, *args, **kwargs):
+        _, key = AuthToken.objects.issue(request.user)
+        return Response({'token': key}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='token/rotate')
+    def rotate_token(self, request, *args, **kwargs):
+        if not isinstance(request.auth, AuthToken):
+            raise ValidationError("Authenticate with the token to rotate")
+        with transaction.atomic():
+            if not AuthToken.objects.filter(pk=request.auth.pk).delete()[0]:
+                raise ValidationError("Token was already revoked")
+            _, key = AuthToken.objects.issue(request.user)
+        return Response({'token': key}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='token/revoke')
+    def revoke_token(self, request, *args, **kwargs):
+        tokens = AuthToken.objects.filter(user=request.user)
+        if not get_bool_data(request, 'all'):
+            if not isinstance(request.auth, AuthToken):
+                raise ValidationError(
+                    "Authenticate with the token to revoke or pass all")
+            tokens = tokens.filter(pk=request.auth.pk)
+        tokens.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfileViewSet(TimedViewMixin, ReplicaReadMixin,
+                     ConfiguredLoggingMixin, viewsets.ModelViewSet):
+    queryset = Profile.objects.prefetch_related('restaurants')
     serializer_class = ProfileSerializer
     permission_classes = (
         permissions.IsAuthenticated,
@@ -167,8 +430,17 @@ class ProfileViewSet(ConfiguredLoggingMixin, viewsets.ModelViewSet):
     http_method_names = ['get', 'options', 'head', 'put', 'patch']
 
 
-class LogEntryView(viewsets.ModelViewSet):
-    queryset = APIRequestLog.objects.all()
+class LogEntryView(TimedViewMixin, ValuesListMixin, viewsets.ModelViewSet):
+    # The default manager joins users, which may live in another database
+    queryset = APIRequestLog.objects.select_related(None)
     serializer_class = LogEntrySerializer
+    pagination_class = LogEntryPagination
     permission_classes = (permissions.IsAdminUser,)
     http_method_names = ['get', 'options', 'head']
+
+    @action(detail=False)
+    def writer(self, request, *args, **kwargs):
+        writer = get_log_writer()
+        if writer is None:
+            return Response({'mode': 'sync'})
+        return Response(dict(writer.stats(), mode='buffered'))
@@ -0,0 +1,131 @@
+from collections import namedtuple
+
+from django.db import IntegrityError, connection, transaction
+
+from .models import Menu, MenuVote, Restaurant
+
+VoteResult = namedtuple('VoteResult', ('voted', 'totalvotes', 'menu_name'))
+
+
+def supports_update_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def add_votes(menu_id, delta):
+    """
+    Adds `delta` to the stored vote count of a menu and returns the new
+    count together with the menu name, or None if the menu doesn't exist.
+    """
+    if not supports_update_returning():
+        if not Menu.objects.filter(pk=menu_id).add_votes(delta):
+            return None
+        menu = Menu.objects.select_related('restaurant').get(pk=menu_id)
+        return menu.totalvotes, str(menu)
+
+    quote_name = connection.ops.quote_name
+    sql = (
+        'UPDATE {menu} SET {totalvotes} = {totalvotes} + %s WHERE {id} = %s '
+        'RETURNING {totalvotes}, {date}, (SELECT {name} FROM {restaurant} '
+        'WHERE {restaurant}.{id} = {menu}.{restaurant_id})'
+    ).format(
+        menu=quote_name(Menu._meta.db_table),
+        restaurant=quote_name(Restaurant._meta.db_table),
+        totalvotes=quote_name('totalvotes'), id=quote_name('id'),
+        date=quote_name('date'), name=quote_name('name'),
+        restaurant_id=quote_name('restaurant_id'))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [delta, menu_id])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    totalvotes, date, restaurant_name = row
+    return totalvotes, restaurant_name + " " + str(date)
+
+
+def delete_votes(user, menu_ids):
+    """
+    Deletes the user's votes for the given menus and returns the ids of
+    the menus that actually had one.
+    """
+    if not menu_ids:
+        return []
+
+    if not supports_update_returning():
+        deleted = list(MenuVote.objects.filter(
+            user=user, menu_id__in=menu_ids).values_list('menu_id', flat=True))
+        MenuVote.objects.filter(user=user, menu_id__in=deleted).delete()
+        return deleted
+
+    quote_name = connection.ops.quote_name
+    sql = 'DELETE FROM {} WHERE {} = %s AND {} IN ({}) RETURNING {}'.format(
+        quote_name(MenuVote._meta.db_table), quote_name('user_id'),
+        quote_name('menu_id'), ', '.join(['%s'] * len(menu_ids)),
+        quote_name('menu_id'))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk] + list(menu_ids))
+        return [menu_id for menu_id, in cursor.fetchall()]
+
+
+def _toggle_vote(menu_id, user):
+    with transaction.atomic():
+        deleted = delete_votes(user, [menu_id])
+        counted = add_votes(menu_id, -1 if deleted else 1)
+        if counted is None:
+            raise Menu.DoesNotExist()
+        if not deleted:
+            MenuVote.objects.create(menu_id=menu_id, user=user)
+        return VoteResult(not deleted, *counted)
+
+
+def toggle_vote(menu_id, user):
+    """
+    Adds the user's vote for a menu, or removes it if it already exists.
+
+    A vote is looked up and removed with a single DELETE; only when nothing
+    was deleted is it inserted. If a concurrent request inserted the same
+    vote in between, the insert hits the unique constraint and the toggle
+    is replayed, which then removes that vote - the same outcome as running
+    both requests one after the other. If the replay conflicts as well,
+    the IntegrityError is raised to the caller.
+    """
+    try:
+        return _toggle_vote(menu_id, user)
+    except IntegrityError:
+        return _toggle_vote(menu_id, user)
+
+
+def _apply_votes(intents, user):
+    with transaction.atomic():
+        removed = delete_votes(user, [
+            menu_id for menu_id, voted in intents.items() if not voted])
+
+        wanted = [menu_id for menu_id, voted in intents.items() if voted]
+        existing = set(MenuVote.objects.filter(
+            user=user, menu_id__in=wanted).values_list('menu_id', flat=True))
+        added = [menu_id for menu_id in wanted if menu_id not in existing]
+        MenuVote.objects.bulk_create([
+            MenuVote(menu_id=menu_id, user=user) for menu_id in added])
+
+        if removed:
+            Menu.objects.filter(pk__in=removed).add_votes(-1)
+        if added:
+            Menu.objects.filter(pk__in=added).add_votes(1)
+
+        return dict(Menu.objects.filter(pk__in=intents).values_list(
+            'id', 'totalvotes'))
+
+
+def apply_votes(intents, user):
+    """
+    Sets the user's vote state for several menus at once. `intents` maps
+    menu ids to the wanted state; the new vote count of each menu is
+    returned in the same kind of mapping.
+    """
+    try:
+        return _apply_votes(intents, user)
+    except IntegrityError:
+        return _apply_votes(intents, user)